@@ -0,0 +1,719 @@
+"""In-memory storage engine.
+
+Routes talk to storage only through get_database() and the subset of the
+Motor collection API below (find/find_one/count_documents, insert, update,
+delete, find_one_and_update, bulk_write, aggregate, index management).
+InMemoryCollection implements that same interface over plain dicts, so
+STORAGE_ENGINE=memory runs every endpoint with no Mongo server, e.g. for
+profiling and load tests. Behaviour follows MongoDB for every operator it
+accepts; anything else raises NotImplementedError rather than guessing.
+"""
+from collections import OrderedDict
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ReturnDocument, InsertOne, UpdateOne, UpdateMany
+from pymongo.errors import DuplicateKeyError, BulkWriteError, OperationFailure
+
+_MISSING = object()
+
+def _clone(value):
+    if isinstance(value, dict):
+        return {key: _clone(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_clone(item) for item in value]
+    return value
+
+def _get_field(document, path: str):
+    value = document
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return _MISSING
+    return value
+
+def _get_path_values(value, parts: list):
+    # Expression field paths traverse arrays: "$rewards.coin_cost" -> [cost, ...]
+    for position, part in enumerate(parts):
+        if isinstance(value, list):
+            values = [_get_path_values(item, parts[position:]) for item in value]
+            return [item for item in values if item is not _MISSING]
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return _MISSING
+    return value
+
+def _set_field(document, path: str, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.setdefault(part, {})
+    document[parts[-1]] = value
+
+def _unset_field(document, path: str):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return
+    document.pop(parts[-1], None)
+
+def _bson_type_order(value) -> int:
+    # Cross-type ordering used by MongoDB for sorts and range comparisons
+    if value is None or value is _MISSING:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, list):
+        return 5
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    return 10
+
+def _sort_key(value):
+    order = _bson_type_order(value)
+    if order == 1:
+        return (order, 0)
+    if order in (4, 5, 10):
+        return (order, repr(value))
+    return (order, value)
+
+def _values_equal(value, expected) -> bool:
+    if value is _MISSING:
+        return expected is None
+    if isinstance(value, list) and not isinstance(expected, list):
+        return expected in value
+    return value == expected
+
+def _compare(value, operator: str, argument) -> bool:
+    if value is _MISSING or _bson_type_order(value) != _bson_type_order(argument):
+        return False
+    if operator == "$gt":
+        return value > argument
+    if operator == "$gte":
+        return value >= argument
+    if operator == "$lt":
+        return value < argument
+    return value <= argument
+
+def _is_operator_document(condition) -> bool:
+    return isinstance(condition, dict) and bool(condition) and all(key.startswith("$") for key in condition)
+
+def _match_condition(value, condition) -> bool:
+    if not _is_operator_document(condition):
+        return _values_equal(value, condition)
+    for operator, argument in condition.items():
+        if operator == "$eq":
+            matched = _values_equal(value, argument)
+        elif operator == "$ne":
+            matched = not _values_equal(value, argument)
+        elif operator == "$in":
+            matched = any(_values_equal(value, item) for item in argument)
+        elif operator == "$nin":
+            matched = not any(_values_equal(value, item) for item in argument)
+        elif operator == "$exists":
+            matched = (value is not _MISSING) == bool(argument)
+        elif operator in ("$gt", "$gte", "$lt", "$lte"):
+            matched = _compare(value, operator, argument)
+        elif operator == "$not":
+            matched = not _match_condition(value, argument)
+        else:
+            raise NotImplementedError(f"Unsupported query operator {operator}")
+        if not matched:
+            return False
+    return True
+
+def _matches(document, query) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(_matches(document, clause) for clause in condition):
+                return False
+        elif key == "$and":
+            if not all(_matches(document, clause) for clause in condition):
+                return False
+        elif key == "$nor":
+            if any(_matches(document, clause) for clause in condition):
+                return False
+        elif key == "$expr":
+            if not _truthy(_evaluate_expression(condition, document)):
+                return False
+        elif not _match_condition(_get_field(document, key), condition):
+            return False
+    return True
+
+def _truthy(value) -> bool:
+    # Aggregation truthiness: only null, false and zero are false; "" and [] are true
+    if value is None or value is _MISSING or value is False:
+        return False
+    if isinstance(value, (int, float)):
+        return value != 0
+    return True
+
+def _evaluate_expression(expression, document):
+    """Evaluates the aggregation expressions used in projections and $expr"""
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = _get_path_values(document, expression[1:].split("."))
+        return None if value is _MISSING else value
+    if isinstance(expression, list):
+        return [_evaluate_expression(item, document) for item in expression]
+    if not _is_operator_document(expression):
+        if isinstance(expression, dict):
+            return {key: _evaluate_expression(item, document) for key, item in expression.items()}
+        return expression
+    
+    operator, argument = next(iter(expression.items()))
+    if operator == "$literal":
+        return argument
+    args = _evaluate_expression(argument, document) if isinstance(argument, list) else [_evaluate_expression(argument, document)]
+    if operator == "$ifNull":
+        return next((item for item in args if item is not None), None)
+    if operator == "$toBool":
+        return None if args[0] is None else _truthy(args[0])
+    if operator == "$not":
+        return not _truthy(args[0])
+    if operator == "$and":
+        return all(_truthy(item) for item in args)
+    if operator == "$or":
+        return any(_truthy(item) for item in args)
+    if operator == "$eq":
+        return args[0] == args[1]
+    if operator == "$ne":
+        return args[0] != args[1]
+    if operator in ("$gt", "$gte", "$lt", "$lte"):
+        return _compare(args[0], operator, args[1])
+    if operator == "$add":
+        return sum(item or 0 for item in args)
+    if operator == "$sum":
+        # A single array argument sums its elements; non-numeric values are ignored
+        values = args[0] if len(args) == 1 and isinstance(args[0], list) else args
+        return sum(item for item in values if isinstance(item, (int, float)) and not isinstance(item, bool))
+    if operator == "$first":
+        return args[0][0] if isinstance(args[0], list) and args[0] else None
+    if operator == "$subtract":
+        return (args[0] or 0) - (args[1] or 0)
+    if operator == "$multiply":
+        result = 1
+        for item in args:
+            result *= item or 0
+        return result
+    if operator == "$divide":
+        return args[0] / args[1] if args[1] else None
+    if operator == "$cond":
+        if isinstance(argument, dict):
+            args = [_evaluate_expression(argument[key], document) for key in ("if", "then", "else")]
+        return args[1] if _truthy(args[0]) else args[2]
+    raise NotImplementedError(f"Unsupported expression operator {operator}")
+
+def _project(document, projection):
+    if not projection:
+        return _clone(document)
+    include_id = projection.get("_id", 1) not in (0, False)
+    fields = {path: spec for path, spec in projection.items() if path != "_id"}
+    
+    if any(spec not in (0, False) for spec in fields.values()):
+        result = {}
+        if include_id and "_id" in document:
+            result["_id"] = document["_id"]
+        for path, spec in fields.items():
+            if spec in (1, True):
+                value = _get_field(document, path)
+                if value is not _MISSING:
+                    _set_field(result, path, _clone(value))
+            else:
+                _set_field(result, path, _evaluate_expression(spec, document))
+        return result
+    
+    result = _clone(document)
+    for path in fields:
+        _unset_field(result, path)
+    if not include_id:
+        result.pop("_id", None)
+    return result
+
+def _apply_update(document, update: dict, is_insert: bool = False):
+    for operator, fields in update.items():
+        if operator == "$set" or (operator == "$setOnInsert" and is_insert):
+            for path, value in fields.items():
+                _set_field(document, path, _clone(value))
+        elif operator == "$setOnInsert":
+            continue
+        elif operator == "$unset":
+            for path in fields:
+                _unset_field(document, path)
+        elif operator == "$inc":
+            for path, amount in fields.items():
+                current = _get_field(document, path)
+                _set_field(document, path, (0 if current is _MISSING or current is None else current) + amount)
+        elif operator == "$push":
+            for path, value in fields.items():
+                current = _get_field(document, path)
+                if current is _MISSING:
+                    current = []
+                    _set_field(document, path, current)
+                current.append(_clone(value))
+        else:
+            raise NotImplementedError(f"Unsupported update operator {operator}")
+
+def _sort_documents(documents: list, sort_fields) -> list:
+    for field, direction in reversed(list(sort_fields)):
+        documents.sort(key=lambda document: _sort_key(_get_field(document, field)), reverse=direction < 0)
+    return documents
+
+def _accumulate(operator: str, values: list):
+    if operator == "$sum":
+        return sum(value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool))
+    if operator == "$first":
+        return values[0] if values else None
+    if operator == "$push":
+        return values
+    if operator in ("$max", "$min"):
+        present = [value for value in values if value is not None]
+        if not present:
+            return None
+        return (max if operator == "$max" else min)(present, key=_sort_key)
+    raise NotImplementedError(f"Unsupported accumulator {operator}")
+
+def _run_pipeline(database, documents: list, pipeline: list) -> list:
+    """Applies the aggregation stages the routes use to already cloned documents"""
+    for stage in pipeline:
+        name, spec = next(iter(stage.items()))
+        if name == "$match":
+            documents = [document for document in documents if _matches(document, spec)]
+        elif name == "$project":
+            documents = [_project(document, spec) for document in documents]
+        elif name in ("$set", "$addFields"):
+            for document in documents:
+                values = {path: _evaluate_expression(expression, document) for path, expression in spec.items()}
+                for path, value in values.items():
+                    _set_field(document, path, value)
+        elif name == "$sort":
+            documents = _sort_documents(documents, spec.items())
+        elif name == "$skip":
+            documents = documents[spec:]
+        elif name == "$limit":
+            documents = documents[:spec]
+        elif name == "$unwind":
+            spec = {"path": spec} if isinstance(spec, str) else spec
+            path = spec["path"][1:]
+            unwound = []
+            for document in documents:
+                value = _get_field(document, path)
+                if isinstance(value, list) and value:
+                    for item in value:
+                        copy = _clone(document)
+                        _set_field(copy, path, _clone(item))
+                        unwound.append(copy)
+                elif isinstance(value, list) or value is _MISSING or value is None:
+                    if spec.get("preserveNullAndEmptyArrays"):
+                        copy = _clone(document)
+                        _unset_field(copy, path)
+                        unwound.append(copy)
+                else:
+                    unwound.append(document)
+            documents = unwound
+        elif name == "$lookup":
+            if "let" in spec:
+                raise NotImplementedError("$lookup with let is not supported")
+            foreign = database[spec["from"]]
+            for document in documents:
+                local = _get_path_values(document, spec["localField"].split("."))
+                values = local if isinstance(local, list) else [None if local is _MISSING else local]
+                joined = [_clone(item) for item in foreign._find_documents({spec["foreignField"]: {"$in": values}})]
+                document[spec["as"]] = _run_pipeline(database, joined, spec.get("pipeline", []))
+        elif name == "$group":
+            groups = OrderedDict()
+            for document in documents:
+                key = _evaluate_expression(spec["_id"], document)
+                groups.setdefault(repr(key), (key, []))[1].append(document)
+            grouped = []
+            for key, members in groups.values():
+                result = {"_id": key}
+                for field, accumulator in spec.items():
+                    if field == "_id":
+                        continue
+                    operator, expression = next(iter(accumulator.items()))
+                    result[field] = _accumulate(operator, [_evaluate_expression(expression, member) for member in members])
+                grouped.append(result)
+            documents = grouped
+        elif name == "$setWindowFields":
+            partitions = OrderedDict()
+            for document in documents:
+                key = _evaluate_expression(spec.get("partitionBy"), document)
+                partitions.setdefault(repr(key), []).append(document)
+            documents = []
+            for members in partitions.values():
+                _sort_documents(members, spec.get("sortBy", {}).items())
+                sort_fields = list(spec.get("sortBy", {}))
+                previous, rank = None, 0
+                for position, document in enumerate(members, start=1):
+                    values = [_get_field(document, field) for field in sort_fields]
+                    if values != previous:
+                        rank, previous = position, values
+                    for field, window in spec["output"].items():
+                        if "$documentNumber" in window:
+                            document[field] = position
+                        elif "$rank" in window:
+                            document[field] = rank
+                        else:
+                            raise NotImplementedError(f"Unsupported window operator in {field}")
+                documents.extend(members)
+        elif name == "$count":
+            documents = [{spec: len(documents)}]
+        else:
+            raise NotImplementedError(f"Unsupported aggregation stage {name}")
+    return documents
+
+def _upsert_seed(query: dict) -> dict:
+    seed = {}
+    for key, condition in query.items():
+        if key.startswith("$"):
+            continue
+        if _is_operator_document(condition):
+            if "$eq" in condition:
+                _set_field(seed, key, _clone(condition["$eq"]))
+        else:
+            _set_field(seed, key, _clone(condition))
+    return seed
+
+def _index_value(value):
+    # Lists and sub-documents are not indexed; queries on them fall back to a scan
+    if value is _MISSING:
+        return None
+    if isinstance(value, (dict, list)):
+        return _MISSING
+    return value
+
+class InMemoryResult:
+    """Carries the attributes routes read from pymongo result objects"""
+
+    def __init__(self, **fields):
+        self.inserted_id = None
+        self.inserted_ids = []
+        self.matched_count = 0
+        self.modified_count = 0
+        self.deleted_count = 0
+        self.upserted_id = None
+        self.__dict__.update(fields)
+
+class InMemoryCursor:
+    def __init__(self, collection, query, projection):
+        self._collection = collection
+        self._query = query or {}
+        self._projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+        self._iterator = None
+
+    def sort(self, key_or_list, direction=None):
+        if isinstance(key_or_list, str):
+            self._sort = [(key_or_list, direction or 1)]
+        else:
+            self._sort = list(key_or_list)
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    def _results(self) -> list:
+        documents = _sort_documents(self._collection._find_documents(self._query), self._sort)
+        end = self._skip + self._limit if self._limit else None
+        return [_project(document, self._projection) for document in documents[self._skip:end]]
+
+    async def to_list(self, length=None):
+        results = self._results()
+        return results[:length] if length else results
+
+    def __aiter__(self):
+        self._iterator = iter(self._results())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class InMemoryAggregateCursor:
+    def __init__(self, documents: list):
+        self._documents = documents
+        self._iterator = iter(documents)
+
+    def batch_size(self, size: int):
+        return self
+
+    async def to_list(self, length=None):
+        return self._documents[:length] if length else self._documents
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class InMemoryCollection:
+    """Dict-backed collection with hash lookups on the leading field of every index"""
+
+    def __init__(self, name: str, database=None):
+        self.name = name
+        # Needed to resolve $lookup stages against sibling collections
+        self.database = database
+        self._documents = {}
+        self._sequence = {}
+        self._next_sequence = 0
+        self._indexes = {"_id_": {"key": [("_id", 1)], "unique": True}}
+        # field -> {value: {_id, ...}}; documents whose value is not hashable live under _MISSING
+        self._lookups = {"_id": {}}
+        # index name -> {tuple of key values: _id}
+        self._unique_keys = {"_id_": {}}
+
+    # Index maintenance
+    def _unique_key(self, index_name: str, document):
+        return tuple(_index_value(_get_field(document, field)) for field, _ in self._indexes[index_name]["key"])
+
+    def _check_unique(self, document, ignore_id=None):
+        for index_name, keys in self._unique_keys.items():
+            owner = keys.get(self._unique_key(index_name, document))
+            if owner is not None and owner != ignore_id:
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {index_name}")
+
+    def _index_add(self, document):
+        for field, lookup in self._lookups.items():
+            lookup.setdefault(_index_value(_get_field(document, field)), set()).add(document["_id"])
+        for index_name, keys in self._unique_keys.items():
+            keys[self._unique_key(index_name, document)] = document["_id"]
+
+    def _index_remove(self, document):
+        for field, lookup in self._lookups.items():
+            bucket = lookup.get(_index_value(_get_field(document, field)))
+            if bucket is not None:
+                bucket.discard(document["_id"])
+        for index_name, keys in self._unique_keys.items():
+            keys.pop(self._unique_key(index_name, document), None)
+
+    def _find_documents(self, query) -> list:
+        query = query or {}
+        for field, condition in query.items():
+            if field not in self._lookups:
+                continue
+            if _is_operator_document(condition):
+                if "$eq" in condition:
+                    values = [condition["$eq"]]
+                elif "$in" in condition:
+                    values = condition["$in"]
+                else:
+                    continue
+            else:
+                values = [condition]
+            if any(isinstance(value, (dict, list)) for value in values):
+                continue
+            
+            lookup = self._lookups[field]
+            ids = set(lookup.get(_MISSING, ()))
+            for value in values:
+                ids |= lookup.get(value, set())
+            ordered = sorted(ids, key=self._sequence.__getitem__)
+            return [self._documents[_id] for _id in ordered if _matches(self._documents[_id], query)]
+        return [document for document in self._documents.values() if _matches(document, query)]
+
+    # Indexes
+    async def create_index(self, keys, name=None, unique=False, **options):
+        keys = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        if name in self._indexes:
+            return name
+        
+        if unique:
+            seen = {}
+            for document in self._documents.values():
+                key = tuple(_index_value(_get_field(document, field)) for field, _ in keys)
+                if key in seen:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {name}")
+                seen[key] = document["_id"]
+            self._unique_keys[name] = seen
+        
+        self._indexes[name] = {"key": keys, "unique": bool(unique), **options}
+        leading_field = keys[0][0]
+        if leading_field not in self._lookups:
+            lookup = {}
+            for document in self._documents.values():
+                lookup.setdefault(_index_value(_get_field(document, leading_field)), set()).add(document["_id"])
+            self._lookups[leading_field] = lookup
+        return name
+
+    async def index_information(self) -> dict:
+        return {name: _clone(info) for name, info in self._indexes.items()}
+
+    # Reads
+    def find(self, filter=None, projection=None, **kwargs):
+        cursor = InMemoryCursor(self, filter, projection)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        return cursor
+
+    async def find_one(self, filter=None, projection=None, **kwargs):
+        results = await self.find(filter, projection, **kwargs).limit(1).to_list(1)
+        return results[0] if results else None
+
+    async def count_documents(self, filter=None, **kwargs) -> int:
+        return len(self._find_documents(filter))
+
+    def watch(self, *args, **kwargs):
+        # What a standalone mongod answers; callers fall back to polling
+        raise OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+
+    def aggregate(self, pipeline, **kwargs):
+        # A leading $match can use the index lookups like find() does
+        if pipeline and "$match" in pipeline[0]:
+            documents, pipeline = self._find_documents(pipeline[0]["$match"]), pipeline[1:]
+        else:
+            documents = list(self._documents.values())
+        documents = _run_pipeline(self.database, [_clone(document) for document in documents], list(pipeline))
+        return InMemoryAggregateCursor(documents)
+
+    # Writes
+    def _insert(self, document):
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        stored = _clone(document)
+        self._check_unique(stored)
+        self._documents[stored["_id"]] = stored
+        self._sequence[stored["_id"]] = self._next_sequence
+        self._next_sequence += 1
+        self._index_add(stored)
+        return stored["_id"]
+
+    def _replace(self, current, updated):
+        self._check_unique(updated, ignore_id=current["_id"])
+        self._index_remove(current)
+        self._documents[current["_id"]] = updated
+        self._index_add(updated)
+
+    def _update(self, query, update, upsert=False, multi=False, return_after=None, projection=None, sort=None):
+        documents = self._find_documents(query)
+        if sort:
+            _sort_documents(documents, sort)
+        if not multi:
+            documents = documents[:1]
+        
+        if not documents:
+            if not upsert:
+                return InMemoryResult(), None
+            document = _upsert_seed(query)
+            _apply_update(document, update, is_insert=True)
+            upserted_id = self._insert(document)
+            returned = _project(self._documents[upserted_id], projection) if return_after else None
+            return InMemoryResult(upserted_id=upserted_id), returned
+        
+        modified = 0
+        returned = None
+        for current in documents:
+            updated = _clone(current)
+            _apply_update(updated, update)
+            if return_after is False:
+                returned = _project(current, projection)
+            if updated != current:
+                self._replace(current, updated)
+                modified += 1
+            if return_after:
+                returned = _project(updated, projection)
+        return InMemoryResult(matched_count=len(documents), modified_count=modified), returned
+
+    async def insert_one(self, document, **kwargs):
+        return InMemoryResult(inserted_id=self._insert(document))
+
+    async def insert_many(self, documents, ordered=True, **kwargs):
+        inserted_ids = []
+        errors = []
+        for position, document in enumerate(documents):
+            try:
+                inserted_ids.append(self._insert(document))
+            except DuplicateKeyError as e:
+                errors.append({"index": position, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted_ids)})
+        return InMemoryResult(inserted_ids=inserted_ids)
+
+    async def update_one(self, filter, update, upsert=False, **kwargs):
+        return self._update(filter, update, upsert=upsert)[0]
+
+    async def update_many(self, filter, update, upsert=False, **kwargs):
+        return self._update(filter, update, upsert=upsert, multi=True)[0]
+
+    async def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False,
+                                  return_document=ReturnDocument.BEFORE, **kwargs):
+        return self._update(
+            filter, update, upsert=upsert, return_after=bool(return_document),
+            projection=projection, sort=sort
+        )[1]
+
+    async def bulk_write(self, requests, ordered=True, **kwargs):
+        counts = {"inserted_count": 0, "matched_count": 0, "modified_count": 0, "upserted_count": 0}
+        for operation in requests:
+            if isinstance(operation, InsertOne):
+                self._insert(operation._doc)
+                counts["inserted_count"] += 1
+            elif isinstance(operation, (UpdateOne, UpdateMany)):
+                result, _ = self._update(
+                    operation._filter, operation._doc, upsert=operation._upsert,
+                    multi=isinstance(operation, UpdateMany)
+                )
+                counts["matched_count"] += result.matched_count
+                counts["modified_count"] += result.modified_count
+                counts["upserted_count"] += 1 if result.upserted_id is not None else 0
+            else:
+                raise NotImplementedError(f"Unsupported bulk operation {type(operation).__name__}")
+        return InMemoryResult(**counts)
+
+    async def delete_one(self, filter, **kwargs):
+        return await self._delete(filter, multi=False)
+
+    async def delete_many(self, filter, **kwargs):
+        return await self._delete(filter, multi=True)
+
+    async def _delete(self, query, multi: bool):
+        documents = self._find_documents(query)
+        if not multi:
+            documents = documents[:1]
+        for document in documents:
+            self._index_remove(document)
+            del self._documents[document["_id"]]
+            del self._sequence[document["_id"]]
+        return InMemoryResult(deleted_count=len(documents))
+
+class InMemoryDatabase:
+    def __init__(self, name: str):
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> InMemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = InMemoryCollection(name, self)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> InMemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
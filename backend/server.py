@@ -1,15 +1,35 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring, ReturnDocument, UpdateOne, UpdateMany
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, BulkWriteError, OperationFailure
+from memory_engine import InMemoryDatabase, InMemoryCollection
 import os
+import io
+import csv
 import logging
+import asyncio
+import threading
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Optional
 import uuid
-from datetime import datetime, timedelta
+import time
+import math
+import json
+import base64
+import random
+import hashlib
+import secrets
+import bisect
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
 import jwt
 import bcrypt
 from enum import Enum
@@ -21,56 +41,404 @@ load_dotenv(ROOT_DIR / '.env')
 import ssl
 import certifi
 
-mongo_url = os.environ['MONGO_URL']
+# mongo (default) or memory; see InMemoryDatabase
+STORAGE_ENGINE = os.environ.get('STORAGE_ENGINE', 'mongo').lower()
+
+mongo_url = os.environ['MONGO_URL'] if STORAGE_ENGINE == 'mongo' else os.environ.get('MONGO_URL')
+db_name = os.environ.get('DB_NAME', 'agent_crm')
+
+# Connection pool tuning for backend/server.py; main.py and deployment-package/main.py keep their own settings
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '2'))
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '10'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '10000'))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '10000'))
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', '')  # e.g. "zstd,snappy,zlib"
+MONGO_TLS_ALLOW_INVALID_CERTIFICATES = os.environ.get('MONGO_TLS_ALLOW_INVALID_CERTIFICATES', 'true').lower() == 'true'
+
+# Circuit breaker around connection attempts: it opens after THRESHOLD failures within WINDOW seconds
+DB_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('DB_BREAKER_FAILURE_THRESHOLD', '3'))
+DB_BREAKER_FAILURE_WINDOW_SECONDS = float(os.environ.get('DB_BREAKER_FAILURE_WINDOW_SECONDS', '30'))
+DB_BREAKER_BASE_BACKOFF_SECONDS = float(os.environ.get('DB_BREAKER_BASE_BACKOFF_SECONDS', '1'))
+DB_BREAKER_MAX_BACKOFF_SECONDS = float(os.environ.get('DB_BREAKER_MAX_BACKOFF_SECONDS', '60'))
+# How often startup work (indexes, migrations) is retried when the database was down at boot
+BOOTSTRAP_RETRY_SECONDS = float(os.environ.get('BOOTSTRAP_RETRY_SECONDS', '5'))
+
 client = None
 db = None
 
-async def get_database():
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Tracks connection pool usage so the pool can be sized against real load"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.open_connections = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.check_outs = 0
+        self.check_out_failures = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.pool_clears = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+
+    def connection_check_out_started(self, event):
+        # Checkout events fire on the thread that performs the checkout
+        self._local.started_at = time.monotonic()
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.check_out_failures += 1
+
+    def connection_checked_out(self, event):
+        started_at = getattr(self._local, "started_at", None)
+        wait_seconds = time.monotonic() - started_at if started_at is not None else 0.0
+        with self._lock:
+            self.check_outs += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def stats(self) -> dict:
+        return {
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "open_connections": self.open_connections,
+            "checked_out": self.checked_out,
+            "max_checked_out": self.max_checked_out,
+            "check_outs": self.check_outs,
+            "check_out_failures": self.check_out_failures,
+            "avg_wait_ms": round(self.total_wait_seconds / self.check_outs * 1000, 3) if self.check_outs else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+            "pool_clears": self.pool_clears
+        }
+
+pool_listener = PoolStatsListener()
+
+# Readiness is only reported once the pool is warm and startup work has finished
+readiness = {"database": False, "pool_warmed": False, "bootstrapped": False, "started": False}
+
+def create_mongo_client() -> AsyncIOMotorClient:
+    options = {
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "tlsAllowInvalidCertificates": MONGO_TLS_ALLOW_INVALID_CERTIFICATES,
+        "event_listeners": [pool_listener]
+    }
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    return AsyncIOMotorClient(mongo_url, **options)
+
+async def ping_database():
+    if STORAGE_ENGINE == "memory":
+        return
+    await client.admin.command('ping')
+
+async def connect_database():
     global client, db
+    if STORAGE_ENGINE == "memory":
+        if db is None:
+            db = InMemoryDatabase(db_name)
+            print(f"Using in-memory storage engine for {db_name}")
+        readiness["database"] = True
+        return db
+    try:
+        client = create_mongo_client()
+        db = client[db_name]
+        await client.admin.command('ping')
+        readiness["database"] = True
+        print(f"MongoDB connected successfully to {db_name}!")
+    except Exception as e:
+        print(f"MongoDB connection failed: {e}")
+        if client is not None:
+            client.close()
+        client = None
+        db = None
+        readiness["database"] = False
+    return db
+
+async def warm_connection_pool():
+    """Open min pool size connections up front so the first requests don't pay for the handshakes"""
+    if STORAGE_ENGINE == "memory":
+        readiness["pool_warmed"] = True
+        return
     if client is None:
-        try:
-            # Try MongoDB Atlas connection first
-            client = AsyncIOMotorClient(
-                mongo_url,
-                serverSelectionTimeoutMS=5000,
-                connectTimeoutMS=10000,
-                socketTimeoutMS=10000,
-                maxPoolSize=10,
-                tlsAllowInvalidCertificates=True
-            )
-            db = client[os.environ.get('DB_NAME', 'agent_crm')]
-            # Test connection
-            await client.admin.command('ping')
-            print("MongoDB Atlas connected successfully!")
-        except Exception as e:
-            print(f"MongoDB Atlas connection failed: {e}")
-            try:
-                # Fall back to local MongoDB
-                client = AsyncIOMotorClient("mongodb://localhost:27017")
-                db = client[os.environ.get('DB_NAME', 'agent_crm')]
-                # Test local connection
-                await client.admin.command('ping')
-                print("Connected to local MongoDB instead")
-            except Exception as local_e:
-                print(f"Local MongoDB connection also failed: {local_e}")
-                client = None
-                db = None
-                return None
+        return
+    # Concurrent pings each need their own connection
+    await asyncio.gather(*[client.admin.command('ping') for _ in range(max(1, MONGO_MIN_POOL_SIZE))])
+    readiness["pool_warmed"] = True
+
+class CircuitBreaker:
+    """Fails fast while the database is unreachable and lets a single probe through to close again"""
+
+    def __init__(self, failure_threshold: int, failure_window_seconds: float, base_backoff_seconds: float, max_backoff_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.failure_window_seconds = failure_window_seconds
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.state = "closed"  # closed, open, half_open
+        # Monotonic times of recent failures; only those inside the window count, so
+        # isolated timeouts spread over hours never add up to a trip
+        self._failures = deque()
+        # Number of times the breaker re-opened without recovering; drives the backoff exponent
+        self.consecutive_trips = 0
+        self.retry_at = 0.0
+        self.trips = 0
+        self.rejected = 0
+        self.probes = 0
+
+    def allow_request(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() >= self.retry_at:
+            self.state = "half_open"
+            self.probes += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def retry_after_seconds(self) -> int:
+        return max(1, math.ceil(self.retry_at - time.monotonic()))
+
+    def recent_failures(self) -> int:
+        horizon = time.monotonic() - self.failure_window_seconds
+        while self._failures and self._failures[0] < horizon:
+            self._failures.popleft()
+        return len(self._failures)
+
+    def record_success(self):
+        self.state = "closed"
+        self._failures.clear()
+        self.consecutive_trips = 0
+
+    def record_failure(self):
+        self._failures.append(time.monotonic())
+        if self.state == "open":
+            # Requests that were already in flight when the breaker tripped report the
+            # same outage; only a failed probe may push the backoff further out
+            return
+        if self.state == "half_open" or self.recent_failures() >= self.failure_threshold:
+            backoff = min(self.max_backoff_seconds, self.base_backoff_seconds * (2 ** self.consecutive_trips))
+            # Equal jitter keeps workers that tripped together from probing together
+            self.retry_at = time.monotonic() + backoff / 2 + random.uniform(0, backoff / 2)
+            self.state = "open"
+            self.consecutive_trips += 1
+            self.trips += 1
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "recent_failures": self.recent_failures(),
+            "retry_in_seconds": round(max(0.0, self.retry_at - time.monotonic()), 2) if self.state == "open" else 0,
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "probes": self.probes
+        }
+
+db_breaker = CircuitBreaker(
+    DB_BREAKER_FAILURE_THRESHOLD, DB_BREAKER_FAILURE_WINDOW_SECONDS,
+    DB_BREAKER_BASE_BACKOFF_SECONDS, DB_BREAKER_MAX_BACKOFF_SECONDS
+)
+_connection_attempt = None
+
+async def _attempt_connection():
+    try:
+        if db is None:
+            if await connect_database() is None:
+                raise ConnectionFailure("MongoDB connection failed")
+        else:
+            await ping_database()
+    except Exception:
+        db_breaker.record_failure()
+        return None
+    db_breaker.record_success()
     return db
 
+# Debug-only query counting: every collection call made while serving a request
+# is counted and reported in the X-Query-Count response header
+QUERY_DEBUG = os.environ.get('QUERY_DEBUG', 'false').lower() == 'true'
+_request_query_count = contextvars.ContextVar("request_query_count", default=None)
+
+class CountingCollection:
+    """Collection wrapper that counts round trips against the current request"""
+    COUNTED_METHODS = {
+        "find", "find_one", "count_documents", "insert_one", "insert_many", "update_one", "update_many",
+        "find_one_and_update", "bulk_write", "delete_one", "delete_many", "aggregate", "distinct"
+    }
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        counter = _request_query_count.get()
+        if counter is None or name not in self.COUNTED_METHODS:
+            return attribute
+
+        def counted(*args, **kwargs):
+            counter[0] += 1
+            return attribute(*args, **kwargs)
+        return counted
+
+class CountingDatabase:
+    def __init__(self, database):
+        self._database = database
+
+    def __getitem__(self, name):
+        return CountingCollection(self._database[name])
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return CountingCollection(getattr(self._database, name))
+
+async def get_database():
+    database = await _resolve_database()
+    if QUERY_DEBUG and database is not None:
+        return CountingDatabase(database)
+    return database
+
+async def _resolve_database():
+    global _connection_attempt
+    # The client is created once by the lifespan hook; everything below only
+    # runs while it is missing or the breaker has seen failures
+    if db is not None and db_breaker.state == "closed":
+        return db
+    
+    attempt_running = _connection_attempt is not None and not _connection_attempt.done()
+    if attempt_running and db_breaker.state == "closed":
+        # Share the in-flight attempt instead of starting another one
+        return await asyncio.shield(_connection_attempt)
+    
+    if attempt_running or not db_breaker.allow_request():
+        raise HTTPException(
+            status_code=503,
+            detail="Database temporarily unavailable",
+            headers={"Retry-After": str(db_breaker.retry_after_seconds())}
+        )
+    
+    _connection_attempt = asyncio.ensure_future(_attempt_connection())
+    return await asyncio.shield(_connection_attempt)
+
+def close_database():
+    global client, db
+    if client is not None:
+        client.close()
+    client = None
+    db = None
+    readiness["database"] = False
+
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-fallback-secret')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
-
-# Create the main app without a prefix
-app = FastAPI()
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRE_MINUTES', '15'))
+REFRESH_TOKEN_EXPIRE_HOURS = int(os.environ.get('REFRESH_TOKEN_EXPIRE_HOURS', str(JWT_EXPIRATION_HOURS)))
+
+# Token revocation filter configuration
+REVOCATION_FILTER_CAPACITY = int(os.environ.get('REVOCATION_FILTER_CAPACITY', '100000'))
+REVOCATION_FILTER_ERROR_RATE = float(os.environ.get('REVOCATION_FILTER_ERROR_RATE', '0.001'))
+REVOCATION_SYNC_SECONDS = float(os.environ.get('REVOCATION_SYNC_SECONDS', '30'))
+
+# Listing pagination. With LEGACY_LIST_RESPONSES on, requests that pass neither
+# limit nor cursor still get the old plain-array response
+LEGACY_LIST_RESPONSES = os.environ.get('LEGACY_LIST_RESPONSES', 'true').lower() == 'true'
+LEGACY_LIST_LIMIT = 1000
+DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', '100'))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '500'))
+
+# Bulk onboarding
+BULK_AGENT_MAX_ROWS = int(os.environ.get('BULK_AGENT_MAX_ROWS', '5000'))
+BATCH_REVIEW_MAX_IDS = int(os.environ.get('BATCH_REVIEW_MAX_IDS', '1000'))
+
+# Streaming exports: cursor batch size and how many rows are written per chunk
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+EXPORT_FLUSH_ROWS = int(os.environ.get('EXPORT_FLUSH_ROWS', '500'))
+
+# Authenticated principal cache configuration
+AUTH_CACHE_TTL_SECONDS = float(os.environ.get('AUTH_CACHE_TTL_SECONDS', '30'))
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get('AUTH_CACHE_MAX_ENTRIES', '10000'))
+
+# Admin queue events: how many recent events a reconnect can resume from, how far a slow
+# subscriber may fall behind before it is told to reload, and the keep-alive interval
+QUEUE_EVENT_BUFFER_SIZE = int(os.environ.get('QUEUE_EVENT_BUFFER_SIZE', '1000'))
+QUEUE_EVENT_SUBSCRIBER_BACKLOG = int(os.environ.get('QUEUE_EVENT_SUBSCRIBER_BACKLOG', '200'))
+QUEUE_EVENT_KEEPALIVE_SECONDS = float(os.environ.get('QUEUE_EVENT_KEEPALIVE_SECONDS', '15'))
+# Single-use tickets that authenticate an EventSource connection in place of a bearer token
+QUEUE_EVENT_TICKET_TTL_SECONDS = float(os.environ.get('QUEUE_EVENT_TICKET_TTL_SECONDS', '30'))
+
+# When enabled, role and shop permissions are trusted from signed token claims
+# and only the per-user token version is checked (against an in-memory cache)
+JWT_SELF_CONTAINED = os.environ.get('JWT_SELF_CONTAINED', 'false').lower() == 'true'
+TOKEN_VERSION_CACHE_TTL_SECONDS = float(os.environ.get('TOKEN_VERSION_CACHE_TTL_SECONDS', '30'))
+
+# Coin request review outcomes remembered for retries (request id -> final status)
+REVIEW_RESULT_CACHE_TTL_SECONDS = float(os.environ.get('REVIEW_RESULT_CACHE_TTL_SECONDS', '600'))
+REVIEW_RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('REVIEW_RESULT_CACHE_MAX_ENTRIES', '10000'))
+
+# Coin ledger: snapshot cadence, how far behind now a snapshot stops (so entries still
+# being written are never folded in) and how reconciliation splits up the agents
+LEDGER_SNAPSHOT_SECONDS = float(os.environ.get('LEDGER_SNAPSHOT_SECONDS', '3600'))
+LEDGER_SNAPSHOT_LAG_SECONDS = float(os.environ.get('LEDGER_SNAPSHOT_LAG_SECONDS', '60'))
+LEDGER_RECONCILE_SECONDS = float(os.environ.get('LEDGER_RECONCILE_SECONDS', '21600'))
+LEDGER_BATCH_SIZE = int(os.environ.get('LEDGER_BATCH_SIZE', '500'))
+LEDGER_RECONCILE_CONCURRENCY = int(os.environ.get('LEDGER_RECONCILE_CONCURRENCY', '4'))
+
+# Prize catalog version: workers re-read the shared counter at most this often
+CATALOG_VERSION_TTL_SECONDS = float(os.environ.get('CATALOG_VERSION_TTL_SECONDS', '2'))
+# Without change streams, how often each worker polls that counter for catalog changes
+PRIZE_CATALOG_POLL_SECONDS = float(os.environ.get('PRIZE_CATALOG_POLL_SECONDS', '5'))
+
+# Password hashing pool configuration
+PASSWORD_POOL_KIND = os.environ.get('PASSWORD_POOL_KIND', 'thread')  # thread or process
+PASSWORD_POOL_WORKERS = int(os.environ.get('PASSWORD_POOL_WORKERS', '4'))
+PASSWORD_POOL_MAX_QUEUE = int(os.environ.get('PASSWORD_POOL_MAX_QUEUE', '64'))
+# Bulk imports hash on their own pool, one thread per CPU by default (bcrypt releases the
+# GIL, so threads scale with cores). At the default bcrypt cost of 12 a core hashes about
+# 3 passwords/s, so a 1,000-row import needs roughly 330 / cores seconds
+BULK_PASSWORD_POOL_WORKERS = int(os.environ.get('BULK_PASSWORD_POOL_WORKERS', str(os.cpu_count() or 1)))
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
 # Security
 security = HTTPBearer()
+# For endpoints that also take the token elsewhere (EventSource cannot set headers)
+optional_security = HTTPBearer(auto_error=False)
 
 # Enums
 class UserRole(str, Enum):
@@ -99,12 +467,27 @@ class UserLogin(BaseModel):
     username: str
     password: str
 
+class CoinRequestBatch(BaseModel):
+    request_ids: List[str]
+    reason: Optional[str] = None
+
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
+class TokenLogout(BaseModel):
+    refresh_token: Optional[str] = None
+
 class User(UserBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: Optional[str] = None
     created_by: Optional[str] = None
     target_monthly: Optional[float] = 0.0
     is_active: bool = True
+    # Bumped whenever credentials or permissions change to invalidate issued access tokens
+    token_version: int = 0
+    # Bumped only when a password changes; refresh tokens are checked against this one,
+    # so a permission or name change re-mints claims on refresh instead of logging out
+    credential_version: int = 0
     # Admin permissions for shop management
     can_create_prizes: bool = False
     can_edit_prizes: bool = False
@@ -114,6 +497,7 @@ class Agent(User):
     coins: float = 0.0
     deposits: float = 0.0
     total_sales: float = 0.0
+    coins_redeemed: float = 0.0
     can_access_shop: bool = True
     last_quarter_reset: Optional[datetime] = None
     target_monthly: float = 0.0
@@ -124,6 +508,9 @@ class SaleRequest(BaseModel):
     sale_amount: SaleAmount
     coins_requested: float
     deposits_requested: float
+    # Denormalized agent display fields, kept in sync on rename
+    agent_name: Optional[str] = None
+    agent_username: Optional[str] = None
     status: str = "pending"  # pending, approved, rejected
     created_at: datetime = Field(default_factory=datetime.utcnow)
     approved_by: Optional[str] = None
@@ -145,11 +532,277 @@ class RewardBagItem(BaseModel):
     agent_id: str
     prize_id: str
     prize_name: str
+    # Cost at redemption time; later prize edits or deletion do not change it
+    coin_cost: float = 0.0
+    agent_name: Optional[str] = None
+    agent_username: Optional[str] = None
     status: str = "unused"  # unused, pending_use, used
     redeemed_at: datetime = Field(default_factory=datetime.utcnow)
     used_at: Optional[datetime] = None
     approved_by: Optional[str] = None
 
+class LedgerEntry(BaseModel):
+    """One append-only change to an agent's counters; amounts are signed deltas"""
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    agent_id: str
+    kind: str  # opening_balance, coin_request_approved, prize_redeemed
+    # The sale request, reward or agent the change came from; unique per kind
+    reference_id: str
+    coins: float = 0.0
+    deposits: float = 0.0
+    total_sales: float = 0.0
+    coins_redeemed: float = 0.0
+    created_by: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+# In-process caches
+class TTLCache:
+    """LRU cache whose entries also expire after a fixed TTL, with hit/miss counters"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        # Bumped on every invalidation so a lookup that raced with a write
+        # does not put a stale document back into the cache
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, generation: Optional[int] = None):
+        if generation is not None and generation != self.generation:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *keys):
+        self.generation += 1
+        for key in keys:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+# user_id -> user document, used by get_current_user
+principal_cache = TTLCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)
+# user_id -> current token_version (-1 for deleted or deactivated users)
+token_version_cache = TTLCache(AUTH_CACHE_MAX_ENTRIES, TOKEN_VERSION_CACHE_TTL_SECONDS)
+
+# sale request id -> "approved" or "rejected", so a retried review is answered without a query
+review_results = TTLCache(REVIEW_RESULT_CACHE_MAX_ENTRIES, REVIEW_RESULT_CACHE_TTL_SECONDS)
+
+def invalidate_user_caches(*user_ids):
+    """Drop cached principals and token versions after credentials or permissions change"""
+    principal_cache.invalidate(*user_ids)
+    token_version_cache.invalidate(*user_ids)
+
+class CatalogVersion:
+    """Monotonic prize catalog version kept in the counters collection, cached per worker for a short TTL"""
+
+    name = "prize_catalog"
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.value = None
+        self._read_at = 0.0
+        self.reads = 0
+        self.bumps = 0
+
+    def _store(self, value: int):
+        # A read that started before a bump must not move the version backwards
+        self.value = value if self.value is None else max(self.value, value)
+        self._read_at = time.monotonic()
+
+    async def current(self, database) -> int:
+        if self.value is not None and time.monotonic() - self._read_at < self.ttl_seconds:
+            return self.value
+        counter = await database.counters.find_one({"name": self.name}, {"_id": 0, "value": 1})
+        self.reads += 1
+        self._store(counter["value"] if counter else 0)
+        return self.value
+
+    async def bump(self, database) -> int:
+        counter = await database.counters.find_one_and_update(
+            {"name": self.name},
+            {"$inc": {"value": 1}},
+            projection={"_id": 0, "value": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self.bumps += 1
+        self._store(counter["value"])
+        return self.value
+
+    def stats(self) -> dict:
+        return {"version": self.value, "ttl_seconds": self.ttl_seconds, "reads": self.reads, "bumps": self.bumps}
+
+catalog_version = CatalogVersion(CATALOG_VERSION_TTL_SECONDS)
+
+class PrizeCatalog:
+    """Every prize held in process, in an InMemoryCollection so listings page exactly as they do against Mongo.
+
+    A change stream on prizes patches it as writes land. Where change streams are not
+    available (standalone servers, the memory engine) the catalog version counter is
+    polled every poll_seconds and the catalog reloaded when it moves.
+    """
+
+    def __init__(self, poll_seconds: float):
+        self.poll_seconds = poll_seconds
+        self.collection = None
+        self.version = None
+        self.digest = None
+        self.size = 0
+        self.mode = "unloaded"
+        self.loaded_at = None
+        self.reloads = 0
+        self.patches = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self.collection is not None
+
+    def source(self, database):
+        """Where prize reads go: the cache once loaded, Mongo until then"""
+        return self.collection if self.loaded else database.prizes
+
+    async def _changed(self):
+        documents = await self.collection.find({}).sort("id", 1).to_list(None)
+        self.digest = hashlib.sha1(json.dumps(documents, default=str, sort_keys=True).encode("utf-8")).hexdigest()[:20]
+        self.size = len(documents)
+
+    async def load(self, database):
+        # The version is read first so a write racing the load shows up as a newer version
+        counter = await database.counters.find_one({"name": CatalogVersion.name}, {"_id": 0, "value": 1})
+        prizes = await database.prizes.find({}).to_list(None)
+        collection = InMemoryCollection("prize_catalog")
+        await collection.create_index("id", unique=True)
+        if prizes:
+            await collection.insert_many(prizes)
+        self.collection = collection
+        self.version = counter["value"] if counter else 0
+        self.loaded_at = datetime.utcnow()
+        self.reloads += 1
+        await self._changed()
+
+    async def put(self, prize: dict):
+        """Insert or replace one prize; local writes call this so their own worker sees them at once"""
+        if not self.loaded or prize is None:
+            return
+        await self.collection.delete_one({"id": prize["id"]})
+        await self.collection.insert_one(dict(prize))
+        self.patches += 1
+        await self._changed()
+
+    async def remove(self, query: dict):
+        if not self.loaded:
+            return
+        await self.collection.delete_one(query)
+        self.patches += 1
+        await self._changed()
+
+    async def apply_change(self, change: dict):
+        operation = change["operationType"]
+        if operation in ("insert", "replace", "update"):
+            if change.get("fullDocument") is not None:
+                await self.put(change["fullDocument"])
+            else:
+                # Deleted again before the update lookup ran
+                await self.remove({"_id": change["documentKey"]["_id"]})
+        elif operation == "delete":
+            await self.remove({"_id": change["documentKey"]["_id"]})
+        elif operation in ("drop", "rename", "dropDatabase", "invalidate"):
+            raise RuntimeError(f"Prize change stream ended by {operation}")
+
+    async def _follow_change_stream(self, database):
+        async with database.prizes.watch(full_document="updateLookup") as stream:
+            # Reload once the stream is open so nothing written before it is missed
+            await self.load(database)
+            self.mode = "change_stream"
+            async for change in stream:
+                await self.apply_change(change)
+
+    async def _poll(self):
+        self.mode = "polling"
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                database = await get_database()
+                if database is None:
+                    continue
+                counter = await database.counters.find_one({"name": CatalogVersion.name}, {"_id": 0, "value": 1})
+                if (counter["value"] if counter else 0) != self.version:
+                    await self.load(database)
+            except Exception as e:
+                print(f"Prize catalog poll failed: {e}")
+
+    async def keep_current(self):
+        """Background task: follow the change stream, falling back to polling where there is none"""
+        while True:
+            try:
+                database = await get_database()
+                if database is not None:
+                    await self._follow_change_stream(database)
+            except OperationFailure as e:
+                print(f"Prize change stream unavailable, polling every {self.poll_seconds}s: {e}")
+                await self._poll()
+            except Exception as e:
+                print(f"Prize change stream interrupted: {e}")
+            self.mode = "reconnecting"
+            await asyncio.sleep(self.poll_seconds)
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "prizes": self.size,
+            "version": self.version,
+            "digest": self.digest,
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+            "reloads": self.reloads,
+            "patches": self.patches
+        }
+
+prize_catalog = PrizeCatalog(PRIZE_CATALOG_POLL_SECONDS)
+
+async def catalog_state(database) -> str:
+    """What catalog ETags are derived from: the cached catalog's digest, or the shared version before it loads"""
+    if prize_catalog.loaded:
+        return prize_catalog.digest
+    return str(await catalog_version.current(database))
+
 # Helper Functions
 def hash_password(password: str) -> str:
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
@@ -157,33 +810,285 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+def _timed_call(fn, submitted_at: float, *args):
+    # Module level so it can be pickled into a process pool worker
+    return time.monotonic() - submitted_at, fn(*args)
+
+class PasswordWorkerPool:
+    """Runs bcrypt work outside the event loop with a bounded backlog"""
+
+    def __init__(self, kind: str, max_workers: int, max_queue: int):
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = None
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password")
+        return self._executor
+
+    async def run(self, fn, *args, enforce_queue_limit: bool = True):
+        if enforce_queue_limit and self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Server busy, please retry")
+        
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            wait_seconds, result = await loop.run_in_executor(
+                self._get_executor(), _timed_call, fn, time.monotonic(), *args
+            )
+        finally:
+            self.in_flight -= 1
+        
+        self.completed += 1
+        self.total_wait_seconds += wait_seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+        return result
+
+    async def map(self, fn, argument_lists: list) -> list:
+        """Runs a batch with at most max_workers of its items in flight.
+
+        Batch items wait for a free worker instead of being rejected, and never
+        occupy more than the workers themselves, so the queue stays available
+        for interactive logins.
+        """
+        semaphore = asyncio.Semaphore(self.max_workers)
+        
+        async def run_one(args):
+            async with semaphore:
+                return await self.run(fn, *args, enforce_queue_limit=False)
+        
+        return await asyncio.gather(*[run_one(args) for args in argument_lists])
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": max(0, self.in_flight - self.max_workers),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 2)
+        }
+
+password_pool = PasswordWorkerPool(PASSWORD_POOL_KIND, PASSWORD_POOL_WORKERS, PASSWORD_POOL_MAX_QUEUE)
+# Only used through map(), which never queues past its workers, so it needs no backlog;
+# logins keep their own workers while an import runs
+bulk_password_pool = PasswordWorkerPool("thread", BULK_PASSWORD_POOL_WORKERS, 0)
+
+async def hash_password_async(password: str) -> str:
+    return await password_pool.run(hash_password, password)
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await password_pool.run(verify_password, password, hashed)
+
 def create_jwt_token(user_data: dict) -> str:
     payload = {
+        "type": "access",
+        "jti": uuid.uuid4().hex,
         "user_id": user_data["id"],
         "username": user_data["username"],
         "role": user_data["role"],
-        "exp": datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS)
+        "name": user_data.get("name", ""),
+        "ver": user_data.get("token_version", 0),
+        "can_create_prizes": user_data.get("can_create_prizes", False),
+        "can_edit_prizes": user_data.get("can_edit_prizes", False),
+        "can_delete_prizes": user_data.get("can_delete_prizes", False),
+        "exp": datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-def decode_jwt_token(token: str) -> dict:
+def create_refresh_token(user_data: dict) -> str:
+    payload = {
+        "type": "refresh",
+        "jti": uuid.uuid4().hex,
+        "user_id": user_data["id"],
+        "cver": user_data.get("credential_version", 0),
+        "exp": datetime.utcnow() + timedelta(hours=REFRESH_TOKEN_EXPIRE_HOURS)
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+def create_token_pair(user_data: dict) -> dict:
+    return {
+        "access_token": create_jwt_token(user_data),
+        "refresh_token": create_refresh_token(user_data),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    }
+
+def decode_jwt_token(token: str, token_type: str = "access") -> dict:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    
+    # Tokens issued before refresh tokens existed have no type and are access tokens
+    if payload.get("type", "access") != token_type:
+        raise HTTPException(status_code=401, detail="Invalid token type")
+    return payload
+
+class BloomFilter:
+    """Fixed-size bloom filter; membership tests never touch the database"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key: str):
+        added = False
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not self._bits[position >> 3] & mask:
+                self._bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class RevocationFilter:
+    """Revoked token ids from the revoked_tokens collection, held in a bloom filter.
+
+    Unknown ids are accepted without a query; only filter hits (revoked tokens
+    and rare false positives) are confirmed against the database.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._filter = BloomFilter(capacity, error_rate)
+        self.last_synced_at = None
+        self.checks = 0
+        self.filter_hits = 0
+        self.confirmed_revocations = 0
+
+    async def load(self, database):
+        """Rebuild the filter from all revocations that have not expired yet"""
+        now = datetime.utcnow()
+        fresh_filter = BloomFilter(self.capacity, self.error_rate)
+        async for entry in database.revoked_tokens.find({"expires_at": {"$gt": now}}, {"_id": 0, "jti": 1}):
+            fresh_filter.add(entry["jti"])
+        self._filter = fresh_filter
+        self.last_synced_at = now
+
+    async def sync(self, database):
+        """Pick up revocations written by other workers since the last sync"""
+        if self.last_synced_at is None or self._filter.count >= self.capacity:
+            await self.load(database)
+            return
+        now = datetime.utcnow()
+        # Overlap the window a little so writes that commit late are not missed
+        since = self.last_synced_at - timedelta(seconds=5)
+        async for entry in database.revoked_tokens.find(
+            {"revoked_at": {"$gt": since}}, {"_id": 0, "jti": 1}
+        ):
+            self._filter.add(entry["jti"])
+        self.last_synced_at = now
+
+    async def revoke(self, database, payload: dict) -> bool:
+        """Record the revocation; False when the token had already been revoked"""
+        self._filter.add(payload["jti"])
+        try:
+            result = await database.revoked_tokens.update_one(
+                {"jti": payload["jti"]},
+                {"$setOnInsert": {
+                    "jti": payload["jti"],
+                    "user_id": payload.get("user_id"),
+                    "type": payload.get("type", "access"),
+                    "expires_at": datetime.utcfromtimestamp(payload["exp"]),
+                    "revoked_at": datetime.utcnow()
+                }},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # A concurrent upsert of the same jti won the unique index
+            return False
+        return result.upserted_id is not None
+
+    async def is_revoked(self, jti: str) -> bool:
+        self.checks += 1
+        if jti not in self._filter:
+            return False
+        
+        self.filter_hits += 1
+        database = await get_database()
+        if database is None:
+            raise HTTPException(status_code=500, detail="Database connection failed")
+        revoked = await database.revoked_tokens.find_one({"jti": jti}, {"_id": 0, "jti": 1})
+        if revoked:
+            self.confirmed_revocations += 1
+        return revoked is not None
+
+    def stats(self) -> dict:
+        return {
+            "entries": self._filter.count,
+            "capacity": self.capacity,
+            "bits": self._filter.size,
+            "hash_count": self._filter.hash_count,
+            "checks": self.checks,
+            "filter_hits": self.filter_hits,
+            "confirmed_revocations": self.confirmed_revocations,
+            "last_synced_at": self.last_synced_at.isoformat() if self.last_synced_at else None
+        }
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
-    payload = decode_jwt_token(token)
+revocation_filter = RevocationFilter(REVOCATION_FILTER_CAPACITY, REVOCATION_FILTER_ERROR_RATE)
+
+async def authenticate_token(token: str, token_type: str = "access") -> dict:
+    payload = decode_jwt_token(token, token_type)
+    if "jti" in payload and await revocation_filter.is_revoked(payload["jti"]):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+    return payload
+
+async def sync_revocations_periodically():
+    while True:
+        await asyncio.sleep(REVOCATION_SYNC_SECONDS)
+        try:
+            database = await get_database()
+            if database is not None:
+                await revocation_filter.sync(database)
+        except Exception as e:
+            print(f"Token revocation sync failed: {e}")
+
+async def load_user(user_id: str) -> dict:
+    cached_user = principal_cache.get(user_id)
+    if cached_user is not None:
+        return dict(cached_user)
     
     database = await get_database()
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
-        
-    user = await database.users.find_one({"id": payload["user_id"]})
+    
+    generation = principal_cache.generation
+    user = await database.users.find_one({"id": user_id})
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     
@@ -191,10 +1096,62 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     if "_id" in user:
         user["_id"] = str(user["_id"])
     
-    return user
+    principal_cache.set(user_id, user, generation=generation)
+    return dict(user)
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    payload = await authenticate_token(credentials.credentials)
+    return await load_user(payload["user_id"])
+
+async def get_token_version(user_id: str) -> int:
+    cached_version = token_version_cache.get(user_id)
+    if cached_version is not None:
+        return cached_version
+    
+    database = await get_database()
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    
+    generation = token_version_cache.generation
+    user = await database.users.find_one({"id": user_id}, {"_id": 0, "token_version": 1, "is_active": 1})
+    if not user or not user.get("is_active", True):
+        version = -1
+    else:
+        version = user.get("token_version", 0)
+    
+    token_version_cache.set(user_id, version, generation=generation)
+    return version
+
+def principal_from_claims(payload: dict) -> dict:
+    return {
+        "id": payload["user_id"],
+        "username": payload["username"],
+        "role": payload["role"],
+        "name": payload.get("name", ""),
+        "token_version": payload["ver"],
+        "can_create_prizes": payload.get("can_create_prizes", False),
+        "can_edit_prizes": payload.get("can_edit_prizes", False),
+        "can_delete_prizes": payload.get("can_delete_prizes", False)
+    }
+
+async def get_principal(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Identity and permissions for authorization checks; skips the user fetch in self-contained mode"""
+    return await principal_for_token(credentials.credentials)
+
+async def principal_for_token(token: str) -> dict:
+    payload = await authenticate_token(token)
+    
+    # Tokens issued before self-contained mode carry no version to check against
+    if not JWT_SELF_CONTAINED or "ver" not in payload:
+        return await load_user(payload["user_id"])
+    
+    if await get_token_version(payload["user_id"]) != payload["ver"]:
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+    
+    return principal_from_claims(payload)
 
 def require_role(required_roles: List[UserRole]):
-    def role_checker(current_user: dict = Depends(get_current_user)):
+    def role_checker(current_user: dict = Depends(get_principal)):
         if current_user["role"] not in [role.value for role in required_roles]:
             raise HTTPException(status_code=403, detail="Insufficient permissions")
         return current_user
@@ -210,6 +1167,342 @@ def convert_objectid_to_string(document):
         return [convert_objectid_to_string(doc) for doc in document]
     return document
 
+# Explicit projections for user listings: password_hash and _id never leave the
+# database and has_password is computed by the server
+USER_LIST_FIELDS = [
+    "id", "username", "role", "name", "created_at", "created_by", "is_active",
+    "target_monthly", "can_create_prizes", "can_edit_prizes", "can_delete_prizes"
+]
+AGENT_LIST_FIELDS = USER_LIST_FIELDS + [
+    "coins", "deposits", "total_sales", "coins_redeemed", "can_access_shop", "last_quarter_reset"
+]
+
+def user_list_projection(fields: List[str], include_has_password: bool = False) -> dict:
+    projection = {"_id": 0}
+    projection.update({field: 1 for field in fields})
+    if include_has_password:
+        # $toBool("") is true in MongoDB, so an empty hash is excluded explicitly
+        projection["has_password"] = {"$and": [{"$ifNull": ["$password_hash", False]}, {"$ne": ["$password_hash", ""]}]}
+    return projection
+
+ADMIN_LIST_PROJECTION = user_list_projection(USER_LIST_FIELDS)
+USER_CREDENTIALS_PROJECTION = user_list_projection(AGENT_LIST_FIELDS, include_has_password=True)
+ADMIN_CREDENTIALS_PROJECTION = user_list_projection(USER_LIST_FIELDS, include_has_password=True)
+AGENT_LIST_PROJECTION = user_list_projection(AGENT_LIST_FIELDS)
+AGENT_CREDENTIALS_PROJECTION = user_list_projection(AGENT_LIST_FIELDS, include_has_password=True)
+
+# Keyset pagination. Every listing sorts on indexed keys ending in the unique
+# "id", and the opaque cursor carries the sort values of the last row served.
+USER_SORT = [("created_at", 1), ("id", 1)]
+SALE_REQUEST_SORT = [("created_at", 1), ("id", 1)]
+REWARD_SORT = [("redeemed_at", 1), ("id", 1)]
+PRIZE_SORT = [("created_at", 1), ("id", 1)]
+LEDGER_SORT = [("created_at", 1), ("id", 1)]
+
+class PageParams:
+    """limit/cursor query parameters shared by all listing endpoints"""
+
+    def __init__(self, limit: Optional[int] = None, cursor: Optional[str] = None):
+        self.limit = limit
+        self.cursor = cursor
+
+    @property
+    def legacy(self) -> bool:
+        return LEGACY_LIST_RESPONSES and self.limit is None and self.cursor is None
+
+    @property
+    def page_size(self) -> int:
+        return max(1, min(self.limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+
+def _encode_cursor_value(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return value
+
+def _decode_cursor_value(value):
+    if isinstance(value, dict) and "$date" in value:
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+def encode_cursor(document: dict, sort_fields) -> str:
+    values = [_encode_cursor_value(document.get(field)) for field, _ in sort_fields]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str, sort_fields) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(sort_fields):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return [_decode_cursor_value(value) for value in values]
+
+def keyset_filter(sort_fields, last_values) -> dict:
+    """Rows strictly after last_values in sort order: (a > x) or (a == x and b > y) ..."""
+    clauses = []
+    for position, (field, direction) in enumerate(sort_fields):
+        clause = {prefix_field: last_values[index] for index, (prefix_field, _) in enumerate(sort_fields[:position])}
+        clause[field] = {"$gt" if direction > 0 else "$lt": last_values[position]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+async def fetch_page(collection, query: dict, projection, sort_fields, page: PageParams):
+    """Returns (documents, next_cursor); next_cursor is None on the last page"""
+    if page.legacy:
+        documents = await collection.find(query, projection).sort(sort_fields).to_list(LEGACY_LIST_LIMIT)
+        return documents, None
+    
+    if page.cursor:
+        query = {"$and": [query, keyset_filter(sort_fields, decode_cursor(page.cursor, sort_fields))]}
+    
+    # One extra row tells us whether another page exists
+    page_size = page.page_size
+    documents = await collection.find(query, projection).sort(sort_fields).limit(page_size + 1).to_list(page_size + 1)
+    if len(documents) <= page_size:
+        return documents, None
+    documents = documents[:page_size]
+    return documents, encode_cursor(documents[-1], sort_fields)
+
+def page_response(documents: list, next_cursor: Optional[str], page: PageParams):
+    if page.legacy:
+        return documents
+    return {"items": documents, "next": next_cursor}
+
+def catalog_etag(scope: str, state: str, page: PageParams) -> str:
+    """Strong validator for one catalog listing: which listing, which catalog state, which page"""
+    variant = hashlib.sha1(f"{page.limit}:{page.cursor}".encode("utf-8")).hexdigest()[:16]
+    return f'"{scope}-{state}-{variant}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def catalog_cache_headers(etag: str) -> dict:
+    # Browsers keep the listing but revalidate every time, so edits show up on the next poll
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+def agent_display_fields(user: dict) -> dict:
+    """Agent fields copied onto sale_requests and reward_bag so listings need no user lookups"""
+    return {
+        "agent_name": user.get("name") or user.get("username"),
+        "agent_username": user.get("username")
+    }
+
+class BatchLoader:
+    """Request-scoped loader: keys asked for in the same tick are fetched with one $in query and memoized"""
+
+    def __init__(self, collection, key_field: str = "id", projection: Optional[dict] = None):
+        self.collection = collection
+        self.key_field = key_field
+        self.projection = projection
+        self._results = {}
+        self._queue = []
+        self._dispatch_scheduled = False
+
+    def load(self, key):
+        if key not in self._results:
+            self._results[key] = asyncio.get_running_loop().create_future()
+            self._queue.append(key)
+            if not self._dispatch_scheduled:
+                self._dispatch_scheduled = True
+                # Runs after every coroutine already scheduled for this tick has queued its keys
+                asyncio.get_running_loop().call_soon(run_in_background, self._dispatch())
+        return self._results[key]
+
+    async def load_many(self, keys) -> list:
+        return list(await asyncio.gather(*[self.load(key) for key in keys]))
+
+    async def _dispatch(self):
+        keys, self._queue, self._dispatch_scheduled = self._queue, [], False
+        try:
+            documents = await self.collection.find({self.key_field: {"$in": keys}}, self.projection).to_list(None)
+        except Exception as e:
+            for key in keys:
+                self._results.pop(key).set_exception(e)
+            return
+        found = {document[self.key_field]: document for document in documents}
+        for key in keys:
+            self._results[key].set_result(found.get(key))
+
+class RequestLoaders:
+    def __init__(self, database):
+        self.users = BatchLoader(database.users, projection={"_id": 0, "password_hash": 0})
+
+async def get_loaders() -> RequestLoaders:
+    # FastAPI resolves a dependency once per request, so the memo lives exactly as long as the request
+    database = await get_database()
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    return RequestLoaders(database)
+
+async def attach_missing_agent_fields(loaders: RequestLoaders, documents: list):
+    # Rows written before the fields were denormalized (until the backfill has run)
+    missing = [document for document in documents if "agent_name" not in document]
+    agents = await loaders.users.load_many(document["agent_id"] for document in missing)
+    for document, agent in zip(missing, agents):
+        if agent:
+            document.update(agent_display_fields(agent))
+
+_background_jobs = set()
+
+def run_in_background(coroutine):
+    """Fire-and-forget work that must not hold up the response"""
+    task = asyncio.create_task(coroutine)
+    # Keep a reference so the task is not garbage collected mid-flight
+    _background_jobs.add(task)
+    task.add_done_callback(_background_jobs.discard)
+    return task
+
+async def propagate_agent_display_fields(agent_id: str, fields: dict):
+    try:
+        database = await get_database()
+        if database is None:
+            return
+        await database.sale_requests.update_many({"agent_id": agent_id}, {"$set": fields})
+        await database.reward_bag.update_many({"agent_id": agent_id}, {"$set": fields})
+    except Exception as e:
+        print(f"Failed to propagate agent rename for {agent_id}: {e}")
+
+# Materialized leaderboard
+LEADERBOARD_TOP_K = int(os.environ.get('LEADERBOARD_TOP_K', '50'))
+LEADERBOARD_NEIGHBOURS = int(os.environ.get('LEADERBOARD_NEIGHBOURS', '2'))
+LEADERBOARD_REFRESH_SECONDS = float(os.environ.get('LEADERBOARD_REFRESH_SECONDS', '300'))
+
+def leaderboard_pipeline() -> list:
+    """Ranks every agent by deposits, reading the coins_redeemed counter kept by redeem_prize"""
+    return [
+        {"$match": {"role": "agent"}},
+        # Matches users_role_deposits_id, so $setWindowFields below needs no extra sort
+        {"$sort": {"deposits": -1, "id": 1}},
+        {"$setWindowFields": {"sortBy": {"deposits": -1, "id": 1}, "output": {"rank": {"$documentNumber": {}}}}},
+        {"$project": {
+            "_id": 0,
+            "id": 1,
+            "name": {"$ifNull": ["$name", "$username", "Unknown"]},
+            "deposits": {"$ifNull": ["$deposits", 0]},
+            "coins_redeemed": {"$ifNull": ["$coins_redeemed", 0]},
+            "total_sales": {"$ifNull": ["$total_sales", 0]},
+            "rank": 1
+        }}
+    ]
+
+class LeaderboardIndex:
+    """Agents kept ordered by (-deposits, id) so a rank is a bisect away instead of a query.
+
+    Write paths apply their increments here as they commit. A periodic rebuild from
+    leaderboard_pipeline() corrects anything missed, e.g. an increment that raced a rebuild.
+    """
+
+    def __init__(self):
+        self._order = []
+        self._entries = {}
+        self._lock = asyncio.Lock()
+        self.loaded = False
+        self.rebuilt_at = None
+
+    @staticmethod
+    def _key(entry: dict) -> tuple:
+        return (-entry["deposits"], entry["id"])
+
+    def _position(self, entry: dict) -> int:
+        return bisect.bisect_left(self._order, self._key(entry))
+
+    def replace(self, entries: list):
+        self._entries = {
+            entry["id"]: {field: entry[field] for field in ("id", "name", "deposits", "coins_redeemed", "total_sales")}
+            for entry in entries
+        }
+        self._order = sorted(self._key(entry) for entry in self._entries.values())
+        self.loaded = True
+        self.rebuilt_at = datetime.utcnow()
+
+    async def rebuild(self, database):
+        self.replace(await database.users.aggregate(leaderboard_pipeline()).to_list(None))
+
+    async def ensure_loaded(self, database):
+        if self.loaded:
+            return
+        async with self._lock:
+            if not self.loaded:
+                await self.rebuild(database)
+
+    def add_agent(self, agent: dict):
+        if not self.loaded or agent["id"] in self._entries:
+            return
+        entry = {
+            "id": agent["id"],
+            "name": agent.get("name") or agent.get("username") or "Unknown",
+            "deposits": agent.get("deposits", 0),
+            "coins_redeemed": agent.get("coins_redeemed", 0),
+            "total_sales": agent.get("total_sales", 0)
+        }
+        self._entries[entry["id"]] = entry
+        bisect.insort(self._order, self._key(entry))
+
+    def adjust(self, agent_id: str, increments: dict):
+        entry = self._entries.get(agent_id)
+        if entry is None:
+            return
+        moved = bool(increments.get("deposits"))
+        if moved:
+            del self._order[self._position(entry)]
+        for field in ("deposits", "coins_redeemed", "total_sales"):
+            if field in increments:
+                entry[field] += increments[field]
+        if moved:
+            bisect.insort(self._order, self._key(entry))
+
+    def rename(self, agent_id: str, name: str):
+        entry = self._entries.get(agent_id)
+        if entry is not None:
+            entry["name"] = name
+
+    def rank(self, agent_id: str) -> Optional[int]:
+        entry = self._entries.get(agent_id)
+        return None if entry is None else self._position(entry) + 1
+
+    def view(self, current_user_id: str, top_k: int, neighbours: int) -> list:
+        """Top k rows plus the caller's own row and neighbours when they fall outside it"""
+        positions = list(range(min(top_k, len(self._order))))
+        rank = self.rank(current_user_id)
+        if rank is not None:
+            start = max(rank - 1 - neighbours, len(positions))
+            positions.extend(range(start, min(rank + neighbours, len(self._order))))
+        rows = []
+        for position in positions:
+            entry = self._entries[self._order[position][1]]
+            rows.append({
+                "name": entry["name"],
+                "deposits": entry["deposits"],
+                "coins_redeemed": entry["coins_redeemed"],
+                "total_sales": entry["total_sales"],
+                "is_current_user": entry["id"] == current_user_id,
+                "rank": position + 1
+            })
+        return rows
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "agents": len(self._entries),
+            "rebuilt_at": self.rebuilt_at.isoformat() if self.rebuilt_at else None
+        }
+
+leaderboard = LeaderboardIndex()
+
+async def refresh_leaderboard_periodically():
+    while True:
+        await asyncio.sleep(LEADERBOARD_REFRESH_SECONDS)
+        try:
+            database = await get_database()
+            if database is not None:
+                await leaderboard.rebuild(database)
+        except Exception as e:
+            print(f"Leaderboard rebuild failed: {e}")
+
 def calculate_coins_and_deposits(sale_amount: str):
     amounts = {
         "100": {"coins": 0.5, "deposits": 1},
@@ -235,10 +1528,389 @@ async def initialize_super_admin():
             is_active=True
         )
         super_admin_dict = super_admin.dict()
-        super_admin_dict["password_hash"] = hash_password("Tharme@789")
+        super_admin_dict["password_hash"] = await hash_password_async("Tharme@789")
         await database.users.insert_one(super_admin_dict)
         print("Super Admin created successfully")
 
+# Indexes every route relies on. Names are part of the declaration so drift
+# (same keys under another name, different options, unknown extras) can be reported.
+INDEX_SPECS = {
+    "users": [
+        {"name": "users_id_unique", "keys": [("id", 1)], "unique": True},
+        {"name": "users_username_unique", "keys": [("username", 1)], "unique": True},
+        {"name": "users_role_created_by", "keys": [("role", 1), ("created_by", 1)]},
+        # Leaderboard order; the trailing id keeps ranks stable between equal deposits
+        {"name": "users_role_deposits_id", "keys": [("role", 1), ("deposits", -1), ("id", 1)]},
+        {"name": "users_role_created_at_id", "keys": [("role", 1), ("created_at", 1), ("id", 1)]}
+    ],
+    "sale_requests": [
+        {"name": "sale_requests_id_unique", "keys": [("id", 1)], "unique": True},
+        {"name": "sale_requests_status_agent", "keys": [("status", 1), ("agent_id", 1)]},
+        {"name": "sale_requests_agent_status", "keys": [("agent_id", 1), ("status", 1)]},
+        {"name": "sale_requests_status_created_at_id", "keys": [("status", 1), ("created_at", 1), ("id", 1)]},
+        {"name": "sale_requests_approval_batch", "keys": [("approval_batch", 1)], "sparse": True},
+        {"name": "sale_requests_rejection_batch", "keys": [("rejection_batch", 1)], "sparse": True}
+    ],
+    "reward_bag": [
+        {"name": "reward_bag_id_unique", "keys": [("id", 1)], "unique": True},
+        {"name": "reward_bag_agent_status", "keys": [("agent_id", 1), ("status", 1)]},
+        {"name": "reward_bag_status_redeemed_at_id", "keys": [("status", 1), ("redeemed_at", 1), ("id", 1)]},
+        {"name": "reward_bag_agent_redeemed_at_id", "keys": [("agent_id", 1), ("redeemed_at", 1), ("id", 1)]}
+    ],
+    "prizes": [
+        {"name": "prizes_id_unique", "keys": [("id", 1)], "unique": True},
+        {"name": "prizes_is_active_created_at_id", "keys": [("is_active", 1), ("created_at", 1), ("id", 1)]},
+        {"name": "prizes_created_at_id", "keys": [("created_at", 1), ("id", 1)]}
+    ],
+    "migrations": [
+        {"name": "migrations_name_unique", "keys": [("name", 1)], "unique": True}
+    ],
+    "counters": [
+        {"name": "counters_name_unique", "keys": [("name", 1)], "unique": True}
+    ],
+    "coin_ledger": [
+        {"name": "coin_ledger_id_unique", "keys": [("id", 1)], "unique": True},
+        {"name": "coin_ledger_kind_reference_unique", "keys": [("kind", 1), ("reference_id", 1)], "unique": True},
+        {"name": "coin_ledger_agent_created_at_id", "keys": [("agent_id", 1), ("created_at", 1), ("id", 1)]}
+    ],
+    "ledger_snapshots": [
+        {"name": "ledger_snapshots_agent_through", "keys": [("agent_id", 1), ("through", -1)]}
+    ],
+    "revoked_tokens": [
+        {"name": "revoked_tokens_jti_unique", "keys": [("jti", 1)], "unique": True},
+        {"name": "revoked_tokens_revoked_at", "keys": [("revoked_at", 1)]},
+        {"name": "revoked_tokens_expires_at_ttl", "keys": [("expires_at", 1)], "expireAfterSeconds": 0}
+    ],
+    "stream_tickets": [
+        {"name": "stream_tickets_ticket_hash_unique", "keys": [("ticket_hash", 1)], "unique": True},
+        {"name": "stream_tickets_expires_at_ttl", "keys": [("expires_at", 1)], "expireAfterSeconds": 0}
+    ]
+}
+
+# Result of the last ensure_indexes run, exposed through the metrics endpoint
+index_report = {"created": [], "drift": [], "errors": []}
+
+def _index_options(index: dict) -> dict:
+    return {
+        "unique": bool(index.get("unique", False)),
+        "sparse": bool(index.get("sparse", False)),
+        "expireAfterSeconds": index.get("expireAfterSeconds")
+    }
+
+async def ensure_indexes(database) -> dict:
+    """Idempotently create the declared indexes and report existing ones that drift from them"""
+    report = {"created": [], "drift": [], "errors": []}
+    
+    for collection_name, specs in INDEX_SPECS.items():
+        collection = database[collection_name]
+        existing = await collection.index_information()
+        existing_by_keys = {tuple(info["key"]): (name, info) for name, info in existing.items()}
+        declared_keys = set()
+        
+        for spec in specs:
+            keys = tuple((field, direction) for field, direction in spec["keys"])
+            declared_keys.add(keys)
+            label = f"{collection_name}.{spec['name']}"
+            
+            if keys in existing_by_keys:
+                existing_name, info = existing_by_keys[keys]
+                if existing_name != spec["name"]:
+                    report["drift"].append(f"{label}: exists as '{existing_name}'")
+                if _index_options(info) != _index_options(spec):
+                    report["drift"].append(f"{label}: options {_index_options(info)} != declared {_index_options(spec)}")
+                continue
+            
+            options = {"name": spec["name"]}
+            if spec.get("unique"):
+                options["unique"] = True
+            if spec.get("sparse"):
+                options["sparse"] = True
+            if spec.get("expireAfterSeconds") is not None:
+                options["expireAfterSeconds"] = spec["expireAfterSeconds"]
+            try:
+                await collection.create_index(list(keys), **options)
+                report["created"].append(label)
+            except Exception as e:
+                report["errors"].append(f"{label}: {e}")
+        
+        for name, info in existing.items():
+            if name != "_id_" and tuple(info["key"]) not in declared_keys:
+                report["drift"].append(f"{collection_name}.{name}: not declared")
+    
+    for label in report["created"]:
+        print(f"Created index {label}")
+    for message in report["drift"]:
+        print(f"Index drift: {message}")
+    for message in report["errors"]:
+        print(f"Index creation failed: {message}")
+    
+    index_report.update(report)
+    return report
+
+# Coin ledger
+#
+# Every change to an agent's coins, deposits, total_sales or coins_redeemed is also
+# appended to coin_ledger. Snapshots fold the ledger up to a cutoff into per-agent
+# totals, so a balance (current or historical) is the newest snapshot at or before
+# that time plus the entries after it.
+LEDGER_FIELDS = ("coins", "deposits", "total_sales", "coins_redeemed")
+LEDGER_SNAPSHOT_MARK = "ledger_snapshot_through"
+
+# Last snapshot and reconciliation runs, exposed through the metrics endpoint
+ledger_report = {"snapshot": None, "reconciliation": None}
+
+def ledger_totals(document: Optional[dict] = None) -> dict:
+    document = document or {}
+    return {field: document.get(field) or 0.0 for field in LEDGER_FIELDS}
+
+async def append_ledger_entries(database, entries: List[LedgerEntry]):
+    if not entries:
+        return
+    try:
+        await database.coin_ledger.insert_many([entry.dict() for entry in entries], ordered=False)
+    except BulkWriteError as e:
+        # (kind, reference_id) is unique, so replaying an entry is harmless
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+
+async def record_ledger_entries(database, entries: List[LedgerEntry]):
+    """Append from a request path: the counters are already updated, so a failure is logged
+    and left for reconciliation to report rather than failing the request"""
+    try:
+        await append_ledger_entries(database, entries)
+    except Exception as e:
+        print(f"Failed to record {len(entries)} ledger entries: {e}")
+
+async def agent_batches(database):
+    """Every agent's id and counters, LEDGER_BATCH_SIZE at a time"""
+    projection = {"_id": 0, "id": 1, **{field: 1 for field in LEDGER_FIELDS}}
+    batch = []
+    async for agent in database.users.find({"role": "agent"}, projection).batch_size(LEDGER_BATCH_SIZE):
+        batch.append(agent)
+        if len(batch) >= LEDGER_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def ledger_balances(database, agent_ids: List[str], as_of: Optional[datetime] = None) -> dict:
+    """agent id -> {totals, through, tail_entries}: newest snapshot plus the entries after it, two queries per batch"""
+    snapshot_match = {"agent_id": {"$in": agent_ids}}
+    if as_of is not None:
+        snapshot_match["through"] = {"$lte": as_of}
+    snapshots = {}
+    async for snapshot in database.ledger_snapshots.aggregate([
+        {"$match": snapshot_match},
+        {"$sort": {"agent_id": 1, "through": -1}},
+        {"$group": {"_id": "$agent_id", "through": {"$first": "$through"}, "totals": {"$first": "$totals"}}}
+    ]):
+        snapshots[snapshot["_id"]] = snapshot
+    
+    balances = {}
+    tails = []
+    for agent_id in agent_ids:
+        snapshot = snapshots.get(agent_id)
+        balances[agent_id] = {
+            "totals": ledger_totals(snapshot["totals"] if snapshot else None),
+            "through": snapshot["through"] if snapshot else None,
+            "tail_entries": 0
+        }
+        tails.append({"agent_id": agent_id, "created_at": {"$gte": snapshot["through"]}} if snapshot else {"agent_id": agent_id})
+    tail_match = {"$or": tails}
+    if as_of is not None:
+        tail_match = {"$and": [tail_match, {"created_at": {"$lt": as_of}}]}
+    
+    async for tail in database.coin_ledger.aggregate([
+        {"$match": tail_match},
+        {"$group": {"_id": "$agent_id", "entries": {"$sum": 1}, **{field: {"$sum": f"${field}"} for field in LEDGER_FIELDS}}}
+    ]):
+        balance = balances[tail["_id"]]
+        balance["tail_entries"] = tail["entries"]
+        for field in LEDGER_FIELDS:
+            balance["totals"][field] += tail[field]
+    return balances
+
+async def take_ledger_snapshots(database) -> Optional[dict]:
+    """Fold each agent's entries older than the lag into a new snapshot"""
+    cutoff = datetime.utcnow() - timedelta(seconds=LEDGER_SNAPSHOT_LAG_SECONDS)
+    # Best-effort claim so only one worker snapshots per period. Every snapshot is built
+    # on the agent's own previous one, so a duplicate or an abandoned run is still correct
+    try:
+        await database.counters.update_one(
+            {"name": LEDGER_SNAPSHOT_MARK, "value": {"$lt": cutoff - timedelta(seconds=LEDGER_SNAPSHOT_SECONDS / 2)}},
+            {"$set": {"value": cutoff}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return None
+    
+    started = time.monotonic()
+    written = 0
+    async for batch in agent_batches(database):
+        balances = await ledger_balances(database, [agent["id"] for agent in batch], as_of=cutoff)
+        snapshots = [
+            {
+                "id": str(uuid.uuid4()),
+                "agent_id": agent_id,
+                "through": cutoff,
+                "totals": balance["totals"],
+                "taken_at": datetime.utcnow()
+            }
+            for agent_id, balance in balances.items() if balance["tail_entries"]
+        ]
+        if snapshots:
+            await database.ledger_snapshots.insert_many(snapshots, ordered=False)
+            written += len(snapshots)
+    
+    report = {"through": cutoff.isoformat(), "snapshots_written": written, "seconds": round(time.monotonic() - started, 3)}
+    ledger_report["snapshot"] = report
+    return report
+
+def _ledger_differences(agents: list, balances: dict) -> list:
+    differences = []
+    for agent in agents:
+        counters = ledger_totals(agent)
+        ledger = balances[agent["id"]]["totals"]
+        if any(abs(counters[field] - ledger[field]) > 1e-6 for field in LEDGER_FIELDS):
+            differences.append({"agent_id": agent["id"], "counters": counters, "ledger": ledger})
+    return differences
+
+async def reconcile_ledger(database) -> dict:
+    """Check every agent's counters against snapshot + tail, LEDGER_RECONCILE_CONCURRENCY batches at a time"""
+    started = time.monotonic()
+    semaphore = asyncio.Semaphore(LEDGER_RECONCILE_CONCURRENCY)
+    suspects = []
+    checked = 0
+    
+    async def check(batch: list):
+        nonlocal checked
+        async with semaphore:
+            balances = await ledger_balances(database, [agent["id"] for agent in batch])
+            suspects.extend(difference["agent_id"] for difference in _ledger_differences(batch, balances))
+            checked += len(batch)
+    
+    checks = [asyncio.create_task(check(batch)) async for batch in agent_batches(database)]
+    await asyncio.gather(*checks)
+    
+    # Counters and ledger are separate writes, so a redeem or approval in flight can look
+    # like drift; only differences that survive a second look are reported
+    mismatches = []
+    if suspects:
+        await asyncio.sleep(1)
+        agents = await database.users.find(
+            {"id": {"$in": suspects}}, {"_id": 0, "id": 1, **{field: 1 for field in LEDGER_FIELDS}}
+        ).to_list(None)
+        mismatches = _ledger_differences(agents, await ledger_balances(database, [agent["id"] for agent in agents]))
+    
+    report = {
+        "finished_at": datetime.utcnow().isoformat(),
+        "agents_checked": checked,
+        "mismatch_count": len(mismatches),
+        "mismatches": mismatches[:100],
+        "seconds": round(time.monotonic() - started, 3)
+    }
+    ledger_report["reconciliation"] = report
+    if mismatches:
+        print(f"Ledger reconciliation found {len(mismatches)} agents whose counters differ from the ledger")
+    return report
+
+async def snapshot_ledger_periodically():
+    while True:
+        await asyncio.sleep(LEDGER_SNAPSHOT_SECONDS)
+        try:
+            database = await get_database()
+            if database is not None:
+                await take_ledger_snapshots(database)
+        except Exception as e:
+            print(f"Ledger snapshot failed: {e}")
+
+async def reconcile_ledger_periodically():
+    while True:
+        await asyncio.sleep(LEDGER_RECONCILE_SECONDS)
+        try:
+            database = await get_database()
+            if database is not None:
+                await reconcile_ledger(database)
+        except Exception as e:
+            print(f"Ledger reconciliation failed: {e}")
+
+# One-shot data migrations, recorded in the migrations collection so each
+# runs once per database
+MIGRATION_BATCH_SIZE = 500
+
+async def backfill_agent_display_fields(database):
+    """Copy agent name/username onto requests and rewards created before they were stored there"""
+    operations = []
+    async for agent in database.users.find({"role": "agent"}, {"_id": 0, "id": 1, "name": 1, "username": 1}):
+        operations.append(UpdateMany(
+            {"agent_id": agent["id"], "agent_name": {"$exists": False}},
+            {"$set": agent_display_fields(agent)}
+        ))
+        if len(operations) >= MIGRATION_BATCH_SIZE:
+            await database.sale_requests.bulk_write(operations, ordered=False)
+            await database.reward_bag.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        await database.sale_requests.bulk_write(operations, ordered=False)
+        await database.reward_bag.bulk_write(operations, ordered=False)
+
+async def backfill_coins_redeemed(database):
+    """Record coin_cost on rewards redeemed before it was stored and total it into users.coins_redeemed"""
+    # Rewards take the prize's current cost; those whose prize is already deleted count as 0,
+    # which is what the leaderboard join gave them
+    operations = [
+        UpdateMany({"prize_id": prize["id"], "coin_cost": {"$exists": False}}, {"$set": {"coin_cost": prize.get("coin_cost", 0)}})
+        async for prize in database.prizes.find({}, {"_id": 0, "id": 1, "coin_cost": 1})
+    ]
+    operations.append(UpdateMany({"coin_cost": {"$exists": False}}, {"$set": {"coin_cost": 0}}))
+    await database.reward_bag.bulk_write(operations, ordered=True)
+    
+    operations = []
+    async for total in database.reward_bag.aggregate([{"$group": {"_id": "$agent_id", "coins": {"$sum": "$coin_cost"}}}]):
+        operations.append(UpdateOne({"id": total["_id"], "role": "agent"}, {"$set": {"coins_redeemed": total["coins"]}}))
+        if len(operations) >= MIGRATION_BATCH_SIZE:
+            await database.users.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        await database.users.bulk_write(operations, ordered=False)
+    await database.users.update_many(
+        {"role": "agent", "coins_redeemed": {"$exists": False}},
+        {"$set": {"coins_redeemed": 0}}
+    )
+
+async def record_opening_balances(database):
+    """One opening_balance entry per agent for the counters accumulated before the ledger existed"""
+    async for batch in agent_batches(database):
+        await append_ledger_entries(database, [
+            LedgerEntry(agent_id=agent["id"], kind="opening_balance", reference_id=agent["id"], **ledger_totals(agent))
+            for agent in batch if any(ledger_totals(agent).values())
+        ])
+
+MIGRATIONS = [
+    ("0001_agent_display_fields", backfill_agent_display_fields),
+    ("0002_coins_redeemed", backfill_coins_redeemed),
+    ("0003_coin_ledger_opening_balances", record_opening_balances)
+]
+
+async def run_migrations(database):
+    for name, migration in MIGRATIONS:
+        if await database.migrations.find_one({"name": name}):
+            continue
+        try:
+            await migration(database)
+            await database.migrations.update_one(
+                {"name": name},
+                {"$setOnInsert": {"name": name, "applied_at": datetime.utcnow()}},
+                upsert=True
+            )
+            print(f"Applied migration {name}")
+        except Exception as e:
+            # Later migrations may read what this one writes (0003 takes opening
+            # balances from counters 0002 backfills), so stop here; the rest run
+            # on the next start once this one succeeds
+            print(f"Migration {name} failed, skipping the remaining migrations: {e}")
+            break
+
 # Routes
 @api_router.post("/auth/login")
 async def login(login_data: UserLogin):
@@ -247,16 +1919,14 @@ async def login(login_data: UserLogin):
         raise HTTPException(status_code=500, detail="Database connection failed")
         
     user = await database.users.find_one({"username": login_data.username})
-    if not user or not verify_password(login_data.password, user["password_hash"]):
+    if not user or not await verify_password_async(login_data.password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     if not user.get("is_active", True):
         raise HTTPException(status_code=401, detail="Account is deactivated")
     
-    token = create_jwt_token(user)
     return {
-        "access_token": token,
-        "token_type": "bearer",
+        **create_token_pair(user),
         "user": {
             "id": user["id"],
             "username": user["username"],
@@ -265,6 +1935,46 @@ async def login(login_data: UserLogin):
         }
     }
 
+@api_router.post("/auth/refresh")
+async def refresh_tokens(refresh_data: TokenRefresh):
+    payload = await authenticate_token(refresh_data.refresh_token, token_type="refresh")
+    
+    database = await get_database()
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    
+    # Claims of the new access token are read fresh, never from the principal cache
+    user = await database.users.find_one({"id": payload["user_id"]})
+    if not user or not user.get("is_active", True):
+        raise HTTPException(status_code=401, detail="User not found")
+    if user.get("credential_version", 0) != payload.get("cver", 0):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+    
+    # Rotate: the presented refresh token is claimed atomically, so concurrent
+    # refreshes on any worker get one new pair between them
+    if not await revocation_filter.revoke(database, payload):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+    return create_token_pair(user)
+
+@api_router.post("/auth/logout")
+async def logout(logout_data: TokenLogout, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    access_payload = await authenticate_token(credentials.credentials)
+    
+    database = await get_database()
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    
+    if "jti" in access_payload:
+        await revocation_filter.revoke(database, access_payload)
+    
+    if logout_data.refresh_token:
+        refresh_payload = decode_jwt_token(logout_data.refresh_token, token_type="refresh")
+        if refresh_payload["user_id"] != access_payload["user_id"]:
+            raise HTTPException(status_code=403, detail="Refresh token belongs to another user")
+        await revocation_filter.revoke(database, refresh_payload)
+    
+    return {"message": "Logged out successfully"}
+
 @api_router.get("/auth/me")
 async def get_current_user_info(current_user: dict = Depends(get_current_user)):
     return {
@@ -278,61 +1988,43 @@ async def get_current_user_info(current_user: dict = Depends(get_current_user)):
 
 # Super Admin Routes
 @api_router.get("/super-admin/admins")
-async def get_all_admins(current_user: dict = Depends(require_role([UserRole.SUPER_ADMIN]))):
+async def get_all_admins(page: PageParams = Depends(), current_user: dict = Depends(require_role([UserRole.SUPER_ADMIN]))):
     database = await get_database()
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
     
-    admins = await database.users.find({"role": "admin"}).to_list(1000)
-    return convert_objectid_to_string(admins)
+    admins, next_cursor = await fetch_page(database.users, {"role": "admin"}, ADMIN_LIST_PROJECTION, USER_SORT, page)
+    return page_response(admins, next_cursor, page)
 
 @api_router.get("/super-admin/all-users")
-async def get_all_users(current_user: dict = Depends(require_role([UserRole.SUPER_ADMIN]))):
+async def get_all_users(page: PageParams = Depends(), current_user: dict = Depends(require_role([UserRole.SUPER_ADMIN]))):
     database = await get_database()
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
     
-    # Get all users except super_admin
-    users = await database.users.find({"role": {"$in": ["admin", "agent"]}}).to_list(1000)
-    
-    # Include credentials for super admin view
-    for user in users:
-        # Keep password_hash for super admin but don't send it in response
-        # We'll return a placeholder indicating password exists
-        user["has_password"] = bool(user.get("password_hash"))
-        user.pop("password_hash", None)
-    
-    return convert_objectid_to_string(users)
+    # Get all users except super_admin; has_password stands in for the hash
+    users, next_cursor = await fetch_page(
+        database.users, {"role": {"$in": ["admin", "agent"]}}, USER_CREDENTIALS_PROJECTION, USER_SORT, page
+    )
+    return page_response(users, next_cursor, page)
 
 @api_router.get("/super-admin/users/admins")
-async def get_admin_users_with_credentials(current_user: dict = Depends(require_role([UserRole.SUPER_ADMIN]))):
+async def get_admin_users_with_credentials(page: PageParams = Depends(), current_user: dict = Depends(require_role([UserRole.SUPER_ADMIN]))):
     database = await get_database()
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
     
-    admins = await database.users.find({"role": "admin"}).to_list(1000)
-    
-    # Format for credentials view
-    for admin in admins:
-        admin["has_password"] = bool(admin.get("password_hash"))
-        admin.pop("password_hash", None)
-    
-    return convert_objectid_to_string(admins)
+    admins, next_cursor = await fetch_page(database.users, {"role": "admin"}, ADMIN_CREDENTIALS_PROJECTION, USER_SORT, page)
+    return page_response(admins, next_cursor, page)
 
 @api_router.get("/super-admin/users/agents")
-async def get_agent_users_with_credentials(current_user: dict = Depends(require_role([UserRole.SUPER_ADMIN]))):
+async def get_agent_users_with_credentials(page: PageParams = Depends(), current_user: dict = Depends(require_role([UserRole.SUPER_ADMIN]))):
     database = await get_database()
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
     
-    agents = await database.users.find({"role": "agent"}).to_list(1000)
-    
-    # Format for credentials view
-    for agent in agents:
-        agent["has_password"] = bool(agent.get("password_hash"))
-        agent.pop("password_hash", None)
-    
-    return convert_objectid_to_string(agents)
+    agents, next_cursor = await fetch_page(database.users, {"role": "agent"}, AGENT_CREDENTIALS_PROJECTION, USER_SORT, page)
+    return page_response(agents, next_cursor, page)
 
 @api_router.post("/super-admin/agents")
 async def create_agent_by_super_admin(user_data: UserCreate, current_user: dict = Depends(require_role([UserRole.SUPER_ADMIN]))):
@@ -351,20 +2043,111 @@ async def create_agent_by_super_admin(user_data: UserCreate, current_user: dict
         created_by=current_user["id"]
     )
     agent_dict = new_agent.dict()
-    agent_dict["password_hash"] = hash_password(user_data.password)
+    agent_dict["password_hash"] = await hash_password_async(user_data.password)
     
     await database.users.insert_one(agent_dict)
+    leaderboard.add_agent(agent_dict)
     return {"message": "Agent created successfully", "agent_id": agent_dict["id"]}
 
+# Streaming exports for payroll reconciliation
+SALE_REQUEST_EXPORT_FIELDS = [
+    "id", "agent_id", "agent_name", "agent_username", "sale_amount", "coins_requested", "deposits_requested", "status",
+    "created_at", "approved_by", "approved_at", "rejected_by", "rejected_at", "rejection_reason"
+]
+REWARD_EXPORT_FIELDS = [
+    "id", "agent_id", "agent_name", "agent_username", "prize_id", "prize_name", "coin_cost", "status", "redeemed_at", "used_at",
+    "approved_by"
+]
+EXPORT_DATASETS = {
+    "agents": {
+        "collection": "users", "query": {"role": "agent"},
+        "fields": AGENT_LIST_FIELDS, "sort": USER_SORT
+    },
+    "coin-requests": {
+        "collection": "sale_requests", "query": {},
+        "fields": SALE_REQUEST_EXPORT_FIELDS, "sort": SALE_REQUEST_SORT
+    },
+    "reward-bag": {
+        "collection": "reward_bag", "query": {},
+        "fields": REWARD_EXPORT_FIELDS, "sort": REWARD_SORT
+    }
+}
+
+def _export_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+async def stream_export_rows(cursor, export_format: str, fields: List[str]):
+    """Writes rows as the cursor yields them, flushing every EXPORT_FLUSH_ROWS rows"""
+    buffer = io.StringIO()
+    writer = None
+    if export_format == "csv":
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+    
+    pending_rows = 0
+    async for document in cursor:
+        if writer is not None:
+            writer.writerow({
+                field: value.isoformat() if isinstance(value, datetime) else value
+                for field, value in document.items()
+            })
+        else:
+            buffer.write(json.dumps(document, default=_export_default))
+            buffer.write("\n")
+        pending_rows += 1
+        
+        if pending_rows >= EXPORT_FLUSH_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending_rows = 0
+    
+    remaining = buffer.getvalue()
+    if remaining:
+        yield remaining
+
+@api_router.get("/super-admin/export/{dataset}")
+async def export_dataset(dataset: str, export_format: str = Query("ndjson", alias="format"), status_filter: Optional[str] = Query(None, alias="status"), current_user: dict = Depends(require_role([UserRole.SUPER_ADMIN]))):
+    export = EXPORT_DATASETS.get(dataset)
+    if export is None:
+        raise HTTPException(status_code=404, detail="Unknown export dataset")
+    if export_format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="Format must be ndjson or csv")
+    
+    database = await get_database()
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    
+    query = dict(export["query"])
+    if status_filter:
+        query["status"] = status_filter
+    projection = {"_id": 0}
+    projection.update({field: 1 for field in export["fields"]})
+    cursor = database[export["collection"]].find(query, projection).sort(export["sort"]).batch_size(EXPORT_BATCH_SIZE)
+    
+    filename = f"{dataset}-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{export_format}"
+    return StreamingResponse(
+        stream_export_rows(cursor, export_format, export["fields"]),
+        media_type="text/csv" if export_format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 # Shop Management - Super Admin Only
 @api_router.get("/super-admin/prizes")
-async def get_all_prizes(current_user: dict = Depends(require_role([UserRole.SUPER_ADMIN]))):
+async def get_all_prizes(request: Request, response: Response, page: PageParams = Depends(), current_user: dict = Depends(require_role([UserRole.SUPER_ADMIN]))):
     database = await get_database()
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
     
-    prizes = await database.prizes.find({}).to_list(1000)
-    return convert_objectid_to_string(prizes)
+    etag = catalog_etag("all", await catalog_state(database), page)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=catalog_cache_headers(etag))
+    
+    prizes, next_cursor = await fetch_page(prize_catalog.source(database), {}, None, PRIZE_SORT, page)
+    response.headers.update(catalog_cache_headers(etag))
+    return page_response(convert_objectid_to_string(prizes), next_cursor, page)
 
 @api_router.post("/super-admin/prizes")
 async def create_prize(prize_data: dict, current_user: dict = Depends(require_role([UserRole.SUPER_ADMIN]))):
@@ -381,7 +2164,10 @@ async def create_prize(prize_data: dict, current_user: dict = Depends(require_ro
         created_by=current_user["id"]
     )
     
-    await database.prizes.insert_one(new_prize.dict())
+    prize_dict = new_prize.dict()
+    await database.prizes.insert_one(prize_dict)
+    await catalog_version.bump(database)
+    await prize_catalog.put(prize_dict)
     return {"message": "Prize created successfully", "prize_id": new_prize.id}
 
 @api_router.put("/super-admin/prizes/{prize_id}")
@@ -404,12 +2190,35 @@ async def update_prize(prize_id: str, prize_data: dict, current_user: dict = Dep
     if "is_active" in prize_data:
         update_data["is_active"] = prize_data["is_active"]
     
-    result = await database.prizes.update_one({"id": prize_id}, {"$set": update_data})
-    if result.matched_count == 0:
+    prize = await database.prizes.find_one_and_update(
+        {"id": prize_id}, {"$set": update_data}, return_document=ReturnDocument.AFTER
+    )
+    if prize is None:
         raise HTTPException(status_code=404, detail="Prize not found")
+    await catalog_version.bump(database)
+    await prize_catalog.put(prize)
     
     return {"message": "Prize updated successfully"}
 
+@api_router.get("/super-admin/metrics")
+async def get_metrics(current_user: dict = Depends(require_role([UserRole.SUPER_ADMIN]))):
+    return {
+        "auth_cache": principal_cache.stats(),
+        "token_version_cache": token_version_cache.stats(),
+        "review_results": review_results.stats(),
+        "queue_events": queue_events.stats(),
+        "token_revocation": revocation_filter.stats(),
+        "password_pool": password_pool.stats(),
+        "bulk_password_pool": bulk_password_pool.stats(),
+        "mongo_pool": pool_listener.stats(),
+        "db_circuit_breaker": db_breaker.stats(),
+        "leaderboard": leaderboard.stats(),
+        "catalog_version": catalog_version.stats(),
+        "prize_catalog": prize_catalog.stats(),
+        "ledger": ledger_report,
+        "indexes": index_report
+    }
+
 # User Credential Management
 @api_router.put("/super-admin/users/{user_id}/credentials")
 async def update_user_credentials(user_id: str, update_data: dict, current_user: dict = Depends(require_role([UserRole.SUPER_ADMIN]))):
@@ -435,15 +2244,27 @@ async def update_user_credentials(user_id: str, update_data: dict, current_user:
         updates["username"] = update_data["username"]
     
     if "password" in update_data and update_data["password"]:
-        updates["password_hash"] = hash_password(update_data["password"])
+        updates["password_hash"] = await hash_password_async(update_data["password"])
     
     if "name" in update_data:
         updates["name"] = update_data["name"]
     
     if updates:
-        result = await database.users.update_one({"id": user_id}, {"$set": updates})
+        increments = {"token_version": 1}
+        if "password_hash" in updates:
+            increments["credential_version"] = 1
+        result = await database.users.update_one(
+            {"id": user_id},
+            {"$set": updates, "$inc": increments}
+        )
+        invalidate_user_caches(user_id)
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        
+        if user.get("role") == "agent" and ("username" in updates or "name" in updates):
+            renamed = {**user, **updates}
+            run_in_background(propagate_agent_display_fields(user_id, agent_display_fields(renamed)))
+            leaderboard.rename(user_id, renamed.get("name") or renamed.get("username"))
     
     return {"message": "User credentials updated successfully"}
 
@@ -470,8 +2291,9 @@ async def update_admin_shop_permissions(admin_id: str, permissions_data: dict, c
     if update_data:
         result = await database.users.update_one(
             {"id": admin_id, "role": "admin"},
-            {"$set": update_data}
+            {"$set": update_data, "$inc": {"token_version": 1}}
         )
+        invalidate_user_caches(admin_id)
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Admin not found")
@@ -485,9 +2307,8 @@ async def create_prize_as_admin(prize_data: dict, current_user: dict = Depends(r
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
     
-    # Check if admin has permission
-    admin = await database.users.find_one({"id": current_user["id"]})
-    if not admin.get("can_create_prizes", False):
+    # Permission flags come with the principal (token claims or cached user document)
+    if not current_user.get("can_create_prizes", False):
         raise HTTPException(status_code=403, detail="You don't have permission to create prizes")
     
     new_prize = Prize(
@@ -499,7 +2320,10 @@ async def create_prize_as_admin(prize_data: dict, current_user: dict = Depends(r
         created_by=current_user["id"]
     )
     
-    await database.prizes.insert_one(new_prize.dict())
+    prize_dict = new_prize.dict()
+    await database.prizes.insert_one(prize_dict)
+    await catalog_version.bump(database)
+    await prize_catalog.put(prize_dict)
     return {"message": "Prize created successfully", "prize_id": new_prize.id}
 
 @api_router.put("/admin/shop/prizes/{prize_id}")
@@ -508,9 +2332,8 @@ async def update_prize_as_admin(prize_id: str, prize_data: dict, current_user: d
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
     
-    # Check if admin has permission
-    admin = await database.users.find_one({"id": current_user["id"]})
-    if not admin.get("can_edit_prizes", False):
+    # Permission flags come with the principal (token claims or cached user document)
+    if not current_user.get("can_edit_prizes", False):
         raise HTTPException(status_code=403, detail="You don't have permission to edit prizes")
     
     update_data = {}
@@ -527,9 +2350,13 @@ async def update_prize_as_admin(prize_id: str, prize_data: dict, current_user: d
     if "is_active" in prize_data:
         update_data["is_active"] = prize_data["is_active"]
     
-    result = await database.prizes.update_one({"id": prize_id}, {"$set": update_data})
-    if result.matched_count == 0:
+    prize = await database.prizes.find_one_and_update(
+        {"id": prize_id}, {"$set": update_data}, return_document=ReturnDocument.AFTER
+    )
+    if prize is None:
         raise HTTPException(status_code=404, detail="Prize not found")
+    await catalog_version.bump(database)
+    await prize_catalog.put(prize)
     
     return {"message": "Prize updated successfully"}
 
@@ -539,32 +2366,25 @@ async def delete_prize_as_admin(prize_id: str, current_user: dict = Depends(requ
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
     
-    # Check if admin has permission
-    admin = await database.users.find_one({"id": current_user["id"]})
-    if not admin.get("can_delete_prizes", False):
+    # Permission flags come with the principal (token claims or cached user document)
+    if not current_user.get("can_delete_prizes", False):
         raise HTTPException(status_code=403, detail="You don't have permission to delete prizes")
     
     result = await database.prizes.delete_one({"id": prize_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Prize not found")
+    await catalog_version.bump(database)
+    await prize_catalog.remove({"id": prize_id})
     
     return {"message": "Prize deleted successfully"}
 
 # Get admin's current permissions
 @api_router.get("/admin/shop/permissions")
 async def get_admin_shop_permissions(current_user: dict = Depends(require_role([UserRole.ADMIN]))):
-    database = await get_database()
-    if database is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
-    admin = await database.users.find_one({"id": current_user["id"]})
-    if not admin:
-        raise HTTPException(status_code=404, detail="Admin not found")
-    
     return {
-        "can_create_prizes": admin.get("can_create_prizes", False),
-        "can_edit_prizes": admin.get("can_edit_prizes", False),
-        "can_delete_prizes": admin.get("can_delete_prizes", False)
+        "can_create_prizes": current_user.get("can_create_prizes", False),
+        "can_edit_prizes": current_user.get("can_edit_prizes", False),
+        "can_delete_prizes": current_user.get("can_delete_prizes", False)
     }
 
 @api_router.post("/super-admin/admins")
@@ -584,7 +2404,7 @@ async def create_admin(user_data: UserCreate, current_user: dict = Depends(requi
         created_by=current_user["id"]
     )
     admin_dict = new_admin.dict()
-    admin_dict["password_hash"] = hash_password(user_data.password)
+    admin_dict["password_hash"] = await hash_password_async(user_data.password)
     
     await database.users.insert_one(admin_dict)
     return {"message": "Admin created successfully", "admin_id": admin_dict["id"]}
@@ -601,8 +2421,12 @@ async def change_admin_password(admin_id: str, password_data: dict, current_user
     
     result = await database.users.update_one(
         {"id": admin_id, "role": "admin"},
-        {"$set": {"password_hash": hash_password(new_password)}}
+        {
+            "$set": {"password_hash": await hash_password_async(new_password)},
+            "$inc": {"token_version": 1, "credential_version": 1}
+        }
     )
+    invalidate_user_caches(admin_id)
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Admin not found")
@@ -616,40 +2440,38 @@ async def delete_admin(admin_id: str, current_user: dict = Depends(require_role(
         raise HTTPException(status_code=500, detail="Database connection failed")
         
     result = await database.users.delete_one({"id": admin_id, "role": "admin"})
+    invalidate_user_caches(admin_id)
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Admin not found")
     return {"message": "Admin deleted successfully"}
 
 # Admin Routes
 @api_router.get("/admin/agents")
-async def get_all_agents(current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
+async def get_all_agents(page: PageParams = Depends(), current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
     database = await get_database()
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
         
     if current_user["role"] == "admin":
         # Admin sees agents they created + agents created by super admin
-        agents = await database.users.find({
+        query = {
             "role": "agent",
             "$or": [
                 {"created_by": current_user["id"]},
                 {"created_by": {"$exists": False}},  # Legacy data
                 {"created_by": {"$in": await get_super_admin_ids(database)}}
             ]
-        }).to_list(1000)
+        }
     else:
         # Super admin sees all agents
-        agents = await database.users.find({"role": "agent"}).to_list(1000)
+        query = {"role": "agent"}
     
-    # Remove password_hash from response
-    for agent in agents:
-        agent.pop("password_hash", None)
-    
-    return convert_objectid_to_string(agents)
+    agents, next_cursor = await fetch_page(database.users, query, AGENT_LIST_PROJECTION, USER_SORT, page)
+    return page_response(agents, next_cursor, page)
 
 async def get_super_admin_ids(database):
     """Helper function to get super admin IDs"""
-    super_admins = await database.users.find({"role": "super_admin"}).to_list(1000)
+    super_admins = await database.users.find({"role": "super_admin"}, {"_id": 0, "id": 1}).to_list(1000)
     return [sa["id"] for sa in super_admins]
 
 @api_router.post("/admin/agents")
@@ -669,11 +2491,104 @@ async def create_agent(user_data: UserCreate, current_user: dict = Depends(requi
         created_by=current_user["id"]
     )
     agent_dict = new_agent.dict()
-    agent_dict["password_hash"] = hash_password(user_data.password)
+    agent_dict["password_hash"] = await hash_password_async(user_data.password)
     
     await database.users.insert_one(agent_dict)
+    leaderboard.add_agent(agent_dict)
     return {"message": "Agent created successfully", "agent_id": agent_dict["id"]}
 
+async def parse_bulk_agent_rows(request: Request) -> list:
+    """Reads a JSON array (or {"agents": [...]}) or a CSV body with username,password,name columns"""
+    body = await request.body()
+    if "text/csv" in request.headers.get("content-type", ""):
+        try:
+            return [dict(row) for row in csv.DictReader(io.StringIO(body.decode("utf-8-sig")))]
+        except (UnicodeDecodeError, csv.Error):
+            raise HTTPException(status_code=400, detail="Invalid CSV body")
+    
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if isinstance(payload, dict):
+        payload = payload.get("agents")
+    if not isinstance(payload, list) or not all(isinstance(row, dict) for row in payload):
+        raise HTTPException(status_code=400, detail="Expected a list of agents")
+    return payload
+
+@api_router.post("/admin/agents/bulk")
+async def create_agents_bulk(request: Request, current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
+    rows = await parse_bulk_agent_rows(request)
+    if not rows:
+        raise HTTPException(status_code=400, detail="No agents provided")
+    if len(rows) > BULK_AGENT_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_AGENT_MAX_ROWS} agents per request")
+    
+    database = await get_database()
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    
+    results = [{"row": index, "username": str(row.get("username") or "").strip()} for index, row in enumerate(rows)]
+    
+    # Validate rows and catch duplicates inside the batch
+    seen_usernames = set()
+    for result, row in zip(results, rows):
+        username = result["username"]
+        if not username or not row.get("password"):
+            result.update({"status": "error", "error": "Username and password are required"})
+        elif username in seen_usernames:
+            result.update({"status": "error", "error": "Duplicate username in request"})
+        else:
+            seen_usernames.add(username)
+    
+    # One query for every username that already exists
+    existing = await database.users.find(
+        {"username": {"$in": list(seen_usernames)}}, {"_id": 0, "username": 1}
+    ).to_list(None)
+    existing_usernames = {user["username"] for user in existing}
+    for result in results:
+        if "status" not in result and result["username"] in existing_usernames:
+            result.update({"status": "error", "error": "Username already exists"})
+    
+    pending = [(result, row) for result, row in zip(results, rows) if "status" not in result]
+    password_hashes = await bulk_password_pool.map(hash_password, [(str(row["password"]),) for _, row in pending])
+    
+    agent_dicts = []
+    for (result, row), password_hash in zip(pending, password_hashes):
+        new_agent = Agent(
+            username=result["username"],
+            role=UserRole.AGENT,
+            name=row.get("name") or result["username"],
+            created_by=current_user["id"]
+        )
+        agent_dict = new_agent.dict()
+        agent_dict["password_hash"] = password_hash
+        agent_dicts.append(agent_dict)
+    
+    failed_positions = {}
+    if agent_dicts:
+        try:
+            await database.users.insert_many(agent_dicts, ordered=False)
+        except BulkWriteError as e:
+            # Usernames taken concurrently hit the unique index; the rest are inserted
+            for error in e.details.get("writeErrors", []):
+                failed_positions[error["index"]] = "Username already exists" if error.get("code") == 11000 else error.get("errmsg", "Insert failed")
+    
+    for position, ((result, _), agent_dict) in enumerate(zip(pending, agent_dicts)):
+        if position in failed_positions:
+            result.update({"status": "error", "error": failed_positions[position]})
+        else:
+            result.update({"status": "created", "agent_id": agent_dict["id"]})
+            leaderboard.add_agent(agent_dict)
+    
+    created = sum(1 for result in results if result["status"] == "created")
+    return {
+        "message": f"{created} of {len(results)} agents created",
+        "created": created,
+        "failed": len(results) - created,
+        "results": results
+    }
+
 @api_router.put("/admin/agents/{agent_id}/target")
 async def update_agent_target(agent_id: str, target_data: dict, current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
     database = await get_database()
@@ -688,6 +2603,7 @@ async def update_agent_target(agent_id: str, target_data: dict, current_user: di
         {"id": agent_id, "role": "agent"},
         {"$set": {"target_monthly": target_monthly}}
     )
+    principal_cache.invalidate(agent_id)
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Agent not found")
@@ -696,70 +2612,125 @@ async def update_agent_target(agent_id: str, target_data: dict, current_user: di
 
 # Coin Request Routes (renamed from sale requests)
 @api_router.get("/admin/coin-requests")
-async def get_pending_coin_requests(current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
+async def get_pending_coin_requests(page: PageParams = Depends(), loaders: RequestLoaders = Depends(get_loaders), current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
     database = await get_database()
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
     
     # Admin and Super Admin can see ALL coin requests (not just from their created agents)
-    requests = await database.sale_requests.find({"status": "pending"}).to_list(1000)
-    
-    # Add agent information to each request
-    for request in requests:
-        agent = await database.users.find_one({"id": request["agent_id"]})
-        if agent:
-            request["agent_name"] = agent.get("name", agent.get("username"))
-            request["agent_username"] = agent.get("username")
-    
-    return convert_objectid_to_string(requests)
+    requests, next_cursor = await fetch_page(database.sale_requests, {"status": "pending"}, None, SALE_REQUEST_SORT, page)
+    
+    # Agent name and username are stored on the request itself
+    await attach_missing_agent_fields(loaders, requests)
+    
+    return page_response(convert_objectid_to_string(requests), next_cursor, page)
+
+def coin_request_ledger_entry(request_id: str, sale_request: dict, approved_by: str) -> LedgerEntry:
+    return LedgerEntry(
+        agent_id=sale_request["agent_id"],
+        kind="coin_request_approved",
+        reference_id=request_id,
+        coins=sale_request["coins_requested"],
+        deposits=sale_request["deposits_requested"],
+        total_sales=float(sale_request["sale_amount"]),
+        created_by=approved_by
+    )
+
+def replay_review(request_id: str, target_status: str) -> bool:
+    """True when this worker already settled the request as target_status; 409 if it went the other way"""
+    settled_status = review_results.get(request_id)
+    if settled_status is None:
+        return False
+    if settled_status != target_status:
+        raise HTTPException(status_code=409, detail=f"Coin request already {settled_status}")
+    return True
+
+async def settle_unmatched_review(database, request_id: str, target_status: str):
+    """The pending-only update matched nothing: 404, an idempotent retry, or a 409 conflict"""
+    current = await database.sale_requests.find_one({"id": request_id}, {"_id": 0, "status": 1})
+    if current is None:
+        raise HTTPException(status_code=404, detail="Coin request not found")
+    if current["status"] != target_status:
+        raise HTTPException(status_code=409, detail=f"Coin request already {current['status']}")
+    review_results.set(request_id, target_status)
+
+async def release_coin_request_approval(database, claim: dict):
+    """Put requests whose approval claimed them but whose credit failed back to pending,
+    so a retry credits them instead of reporting them as already approved"""
+    try:
+        await database.sale_requests.update_many(
+            {**claim, "status": "approved"},
+            {"$set": {"status": "pending"}, "$unset": {"approved_by": "", "approved_at": "", "approval_batch": ""}}
+        )
+    except Exception as e:
+        print(f"Failed to release coin request approval {claim}: {e}")
 
 @api_router.put("/admin/coin-requests/{request_id}/approve")
 async def approve_coin_request(request_id: str, current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
+    if replay_review(request_id, "approved"):
+        return {"message": "Coin request approved successfully"}
+    
     database = await get_database()
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
-        
-    sale_request = await database.sale_requests.find_one({"id": request_id})
-    if not sale_request:
-        raise HTTPException(status_code=404, detail="Coin request not found")
     
-    # Update sale request
-    await database.sale_requests.update_one(
-        {"id": request_id},
+    # Only a pending request can transition, so double clicks and concurrent
+    # reviewers credit the agent exactly once. BSON dates keep milliseconds, so the
+    # claim can be matched again if the credit fails
+    approved_at = datetime.utcnow()
+    approved_at = approved_at.replace(microsecond=approved_at.microsecond // 1000 * 1000)
+    sale_request = await database.sale_requests.find_one_and_update(
+        {"id": request_id, "status": "pending"},
         {"$set": {
             "status": "approved",
             "approved_by": current_user["id"],
-            "approved_at": datetime.utcnow()
-        }}
+            "approved_at": approved_at
+        }},
+        projection={"_id": 0, "agent_id": 1, "coins_requested": 1, "deposits_requested": 1, "sale_amount": 1}
     )
+    if sale_request is None:
+        await settle_unmatched_review(database, request_id, "approved")
+        return {"message": "Coin request approved successfully"}
     
     # Update agent coins and deposits
-    await database.users.update_one(
-        {"id": sale_request["agent_id"]},
-        {"$inc": {
-            "coins": sale_request["coins_requested"],
-            "deposits": sale_request["deposits_requested"],
-            "total_sales": float(sale_request["sale_amount"])
-        }}
-    )
+    try:
+        await database.users.update_one(
+            {"id": sale_request["agent_id"]},
+            {"$inc": {
+                "coins": sale_request["coins_requested"],
+                "deposits": sale_request["deposits_requested"],
+                "total_sales": float(sale_request["sale_amount"])
+            }}
+        )
+    except Exception:
+        await release_coin_request_approval(database, {
+            "id": request_id, "approved_by": current_user["id"], "approved_at": approved_at
+        })
+        raise
+    principal_cache.invalidate(sale_request["agent_id"])
+    leaderboard.adjust(sale_request["agent_id"], {
+        "deposits": sale_request["deposits_requested"],
+        "total_sales": float(sale_request["sale_amount"])
+    })
+    await record_ledger_entries(database, [coin_request_ledger_entry(request_id, sale_request, current_user["id"])])
+    review_results.set(request_id, "approved")
+    queue_events.publish("coin_request", "approved", {"id": request_id, "agent_id": sale_request["agent_id"], "approved_by": current_user["id"]})
     
     return {"message": "Coin request approved successfully"}
 
 @api_router.put("/admin/coin-requests/{request_id}/reject")
 async def reject_coin_request(request_id: str, rejection_data: dict, current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
+    if replay_review(request_id, "rejected"):
+        return {"message": "Coin request rejected successfully"}
+    
     database = await get_database()
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
-        
-    sale_request = await database.sale_requests.find_one({"id": request_id})
-    if not sale_request:
-        raise HTTPException(status_code=404, detail="Coin request not found")
     
     rejection_reason = rejection_data.get("reason", "No reason provided")
     
-    # Update sale request
-    await database.sale_requests.update_one(
-        {"id": request_id},
+    result = await database.sale_requests.update_one(
+        {"id": request_id, "status": "pending"},
         {"$set": {
             "status": "rejected",
             "rejected_by": current_user["id"],
@@ -767,51 +2738,385 @@ async def reject_coin_request(request_id: str, rejection_data: dict, current_use
             "rejection_reason": rejection_reason
         }}
     )
+    if result.matched_count == 0:
+        await settle_unmatched_review(database, request_id, "rejected")
+        return {"message": "Coin request rejected successfully"}
+    review_results.set(request_id, "rejected")
+    queue_events.publish("coin_request", "rejected", {"id": request_id, "rejected_by": current_user["id"], "rejection_reason": rejection_reason})
     
     return {"message": "Coin request rejected successfully"}
 
+def batch_request_ids(batch: CoinRequestBatch) -> List[str]:
+    request_ids = list(dict.fromkeys(batch.request_ids))
+    if not request_ids:
+        raise HTTPException(status_code=400, detail="No request ids provided")
+    if len(request_ids) > BATCH_REVIEW_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_REVIEW_MAX_IDS} requests per batch")
+    return request_ids
+
+async def credit_agents(database, credits: dict) -> List[str]:
+    """Apply aggregated per-agent $inc credits with a single bulk_write; returns the agents
+    whose credit was rejected, other errors propagate with nothing known to be credited"""
+    if not credits:
+        return []
+    agent_ids = list(credits)
+    failed = []
+    try:
+        await database.users.bulk_write(
+            [UpdateOne({"id": agent_id}, {"$inc": credits[agent_id]}) for agent_id in agent_ids],
+            ordered=False
+        )
+    except BulkWriteError as e:
+        # Unordered, so every operation without a write error was applied
+        failed = [agent_ids[error["index"]] for error in e.details.get("writeErrors", [])]
+    credited = [agent_id for agent_id in agent_ids if agent_id not in failed]
+    principal_cache.invalidate(*credited)
+    for agent_id in credited:
+        leaderboard.adjust(agent_id, credits[agent_id])
+    return failed
+
+async def describe_unclaimed_requests(database, request_ids: List[str]) -> dict:
+    """Outcome for ids a batch could not transition: not_found or already_<status>"""
+    if not request_ids:
+        return {}
+    found = await database.sale_requests.find(
+        {"id": {"$in": request_ids}}, {"_id": 0, "id": 1, "status": 1}
+    ).to_list(None)
+    statuses = {request["id"]: request["status"] for request in found}
+    return {
+        request_id: f"already_{statuses[request_id]}" if request_id in statuses else "not_found"
+        for request_id in request_ids
+    }
+
+@api_router.post("/admin/coin-requests/batch-approve")
+async def batch_approve_coin_requests(batch: CoinRequestBatch, current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
+    request_ids = batch_request_ids(batch)
+    database = await get_database()
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    
+    # Claim every still-pending request in one update; the batch id tells us
+    # which ones this call won, so concurrent reviewers never double credit
+    batch_id = str(uuid.uuid4())
+    await database.sale_requests.update_many(
+        {"id": {"$in": request_ids}, "status": "pending"},
+        {"$set": {
+            "status": "approved",
+            "approved_by": current_user["id"],
+            "approved_at": datetime.utcnow(),
+            "approval_batch": batch_id
+        }}
+    )
+    claimed = await database.sale_requests.find(
+        {"approval_batch": batch_id},
+        {"_id": 0, "id": 1, "agent_id": 1, "coins_requested": 1, "deposits_requested": 1, "sale_amount": 1}
+    ).to_list(None)
+    
+    # One $inc per agent no matter how many of their requests were approved
+    credits = {}
+    for sale_request in claimed:
+        increments = credits.setdefault(sale_request["agent_id"], {"coins": 0.0, "deposits": 0.0, "total_sales": 0.0})
+        increments["coins"] += sale_request["coins_requested"]
+        increments["deposits"] += sale_request["deposits_requested"]
+        increments["total_sales"] += float(sale_request["sale_amount"])
+    try:
+        failed_agents = await credit_agents(database, credits)
+    except Exception:
+        await release_coin_request_approval(database, {"approval_batch": batch_id})
+        raise
+    # Requests of agents whose credit was rejected go back to pending for a retry
+    released_ids = [sale_request["id"] for sale_request in claimed if sale_request["agent_id"] in failed_agents]
+    if released_ids:
+        await release_coin_request_approval(database, {"approval_batch": batch_id, "agent_id": {"$in": failed_agents}})
+        claimed = [sale_request for sale_request in claimed if sale_request["agent_id"] not in failed_agents]
+    await record_ledger_entries(database, [
+        coin_request_ledger_entry(sale_request["id"], sale_request, current_user["id"]) for sale_request in claimed
+    ])
+    
+    claimed_ids = {sale_request["id"] for sale_request in claimed}
+    for sale_request in claimed:
+        review_results.set(sale_request["id"], "approved")
+        queue_events.publish("coin_request", "approved", {"id": sale_request["id"], "agent_id": sale_request["agent_id"], "approved_by": current_user["id"]})
+    outcomes = {request_id: "approved" for request_id in claimed_ids}
+    outcomes.update(await describe_unclaimed_requests(
+        database, [i for i in request_ids if i not in claimed_ids and i not in released_ids]
+    ))
+    outcomes.update({request_id: "credit_failed" for request_id in released_ids})
+    return {
+        "message": f"{len(claimed_ids)} coin requests approved",
+        "approved": len(claimed_ids),
+        "agents_credited": len(credits) - len(failed_agents),
+        "results": [{"id": request_id, "outcome": outcomes[request_id]} for request_id in request_ids]
+    }
+
+@api_router.post("/admin/coin-requests/batch-reject")
+async def batch_reject_coin_requests(batch: CoinRequestBatch, current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
+    request_ids = batch_request_ids(batch)
+    database = await get_database()
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    
+    batch_id = str(uuid.uuid4())
+    await database.sale_requests.update_many(
+        {"id": {"$in": request_ids}, "status": "pending"},
+        {"$set": {
+            "status": "rejected",
+            "rejected_by": current_user["id"],
+            "rejected_at": datetime.utcnow(),
+            "rejection_reason": batch.reason or "No reason provided",
+            "rejection_batch": batch_id
+        }}
+    )
+    claimed = await database.sale_requests.find({"rejection_batch": batch_id}, {"_id": 0, "id": 1}).to_list(None)
+    
+    claimed_ids = {sale_request["id"] for sale_request in claimed}
+    for request_id in claimed_ids:
+        review_results.set(request_id, "rejected")
+        queue_events.publish("coin_request", "rejected", {"id": request_id, "rejected_by": current_user["id"], "rejection_reason": batch.reason or "No reason provided"})
+    outcomes = {request_id: "rejected" for request_id in claimed_ids}
+    outcomes.update(await describe_unclaimed_requests(database, [i for i in request_ids if i not in claimed_ids]))
+    return {
+        "message": f"{len(claimed_ids)} coin requests rejected",
+        "rejected": len(claimed_ids),
+        "results": [{"id": request_id, "outcome": outcomes[request_id]} for request_id in request_ids]
+    }
+
+# Coin ledger
+@api_router.get("/admin/agents/{agent_id}/ledger")
+async def get_agent_ledger(agent_id: str, page: PageParams = Depends(), current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
+    database = await get_database()
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    
+    entries, next_cursor = await fetch_page(database.coin_ledger, {"agent_id": agent_id}, {"_id": 0}, LEDGER_SORT, page)
+    return page_response(entries, next_cursor, page)
+
+@api_router.get("/admin/agents/{agent_id}/balance")
+async def get_agent_ledger_balance(agent_id: str, as_of: Optional[datetime] = None, current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
+    """Balance from the ledger, now or at as_of; the current one is shown next to the user counters"""
+    database = await get_database()
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    
+    agent = await database.users.find_one(
+        {"id": agent_id, "role": "agent"}, {"_id": 0, "id": 1, **{field: 1 for field in LEDGER_FIELDS}}
+    )
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    if as_of is not None and as_of.tzinfo is not None:
+        # Stored timestamps are naive UTC
+        as_of = as_of.astimezone(timezone.utc).replace(tzinfo=None)
+    
+    balance = (await ledger_balances(database, [agent_id], as_of))[agent_id]
+    response = {
+        "agent_id": agent_id,
+        "as_of": as_of,
+        "ledger": balance["totals"],
+        "snapshot_through": balance["through"],
+        "tail_entries": balance["tail_entries"]
+    }
+    if as_of is None:
+        response["counters"] = ledger_totals(agent)
+        response["in_sync"] = not _ledger_differences([agent], {agent_id: balance})
+    return response
+
+@api_router.post("/super-admin/ledger/reconcile")
+async def run_ledger_reconciliation(current_user: dict = Depends(require_role([UserRole.SUPER_ADMIN]))):
+    database = await get_database()
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    return await reconcile_ledger(database)
+
 # Admin Shop View (Read-only)
 @api_router.get("/admin/shop/prizes")
-async def get_shop_prizes_admin_view(current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
+async def get_shop_prizes_admin_view(request: Request, response: Response, page: PageParams = Depends(), current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
     database = await get_database()
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
     
-    prizes = await database.prizes.find({}).to_list(1000)
-    return convert_objectid_to_string(prizes)
+    etag = catalog_etag("all", await catalog_state(database), page)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=catalog_cache_headers(etag))
+    
+    prizes, next_cursor = await fetch_page(prize_catalog.source(database), {}, None, PRIZE_SORT, page)
+    response.headers.update(catalog_cache_headers(etag))
+    return page_response(convert_objectid_to_string(prizes), next_cursor, page)
 
 # Admin can see all agents (not just ones they created)
 @api_router.get("/admin/all-agents")
-async def get_all_agents_for_admin(current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
+async def get_all_agents_for_admin(page: PageParams = Depends(), current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
     database = await get_database()
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
     
     # Return all agents for admin visibility
-    agents = await database.users.find({"role": "agent"}).to_list(1000)
-    
-    # Remove password_hash from response
-    for agent in agents:
-        agent.pop("password_hash", None)
-    
-    return convert_objectid_to_string(agents)
+    agents, next_cursor = await fetch_page(database.users, {"role": "agent"}, AGENT_LIST_PROJECTION, USER_SORT, page)
+    return page_response(agents, next_cursor, page)
 
 # Admin can see all reward requests (not just from their agents)
 @api_router.get("/admin/all-reward-requests")
-async def get_all_reward_requests(current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
+async def get_all_reward_requests(page: PageParams = Depends(), loaders: RequestLoaders = Depends(get_loaders), current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
     database = await get_database()
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
         
-    rewards = await database.reward_bag.find({"status": "pending_use"}).to_list(1000)
+    rewards, next_cursor = await fetch_page(database.reward_bag, {"status": "pending_use"}, None, REWARD_SORT, page)
+    
+    # Agent name is stored on the reward itself
+    await attach_missing_agent_fields(loaders, rewards)
+    
+    return page_response(convert_objectid_to_string(rewards), next_cursor, page)
+
+# Admin queue events
+class QueueEventBus:
+    """In-process fan-out of approval queue changes, with a ring buffer so reconnects can resume"""
+
+    def __init__(self, buffer_size: int, subscriber_backlog: int):
+        self._buffer = deque(maxlen=buffer_size)
+        self._subscribers = set()
+        self.subscriber_backlog = subscriber_backlog
+        # Sequence numbers restart with the process, so ids carry a per-process epoch
+        # and an id from another process or an earlier run is never resumed from
+        self.epoch = uuid.uuid4().hex[:8]
+        self.sequence = 0
+        self.published = 0
+        self.overflows = 0
+
+    def publish(self, queue: str, action: str, item: dict):
+        self.sequence += 1
+        event = {"id": f"{self.epoch}-{self.sequence}", "sequence": self.sequence, "event": f"{queue}.{action}", "data": item}
+        self._buffer.append(event)
+        self.published += 1
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too far behind: drop what it has and tell it to reload and reconnect
+                self._subscribers.discard(subscriber)
+                self.overflows += 1
+                while not subscriber.empty():
+                    subscriber.get_nowait()
+                subscriber.put_nowait(None)
+
+    def subscribe(self, last_event_id: Optional[str] = None):
+        """(missed events or None if they can no longer be replayed, subscriber queue)"""
+        subscriber = asyncio.Queue(maxsize=self.subscriber_backlog)
+        self._subscribers.add(subscriber)
+        if not last_event_id:
+            return [], subscriber
+        epoch, _, sequence = last_event_id.partition("-")
+        if epoch != self.epoch or not sequence.isdigit():
+            return None, subscriber
+        after = int(sequence)
+        oldest = self._buffer[0]["sequence"] if self._buffer else self.sequence + 1
+        if after + 1 < oldest:
+            return None, subscriber
+        return [event for event in self._buffer if event["sequence"] > after], subscriber
+
+    def unsubscribe(self, subscriber: asyncio.Queue):
+        self._subscribers.discard(subscriber)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "buffered": len(self._buffer),
+            "published": self.published,
+            "overflows": self.overflows
+        }
+
+queue_events = QueueEventBus(QUEUE_EVENT_BUFFER_SIZE, QUEUE_EVENT_SUBSCRIBER_BACKLOG)
+
+def format_sse(event: dict) -> str:
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+# Sent when missed events cannot be replayed: the client reloads the listings
+QUEUE_RESET_EVENT = "event: reset\ndata: {}\n\n"
+
+async def stream_queue_events(request: Request, backlog: Optional[list], subscriber: asyncio.Queue):
+    try:
+        yield f"retry: {int(QUEUE_EVENT_KEEPALIVE_SECONDS * 1000)}\n\n"
+        if backlog is None:
+            yield QUEUE_RESET_EVENT
+        else:
+            for event in backlog:
+                yield format_sse(event)
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(subscriber.get(), QUEUE_EVENT_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                # Comment line; keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                yield QUEUE_RESET_EVENT
+                break
+            yield format_sse(event)
+    finally:
+        queue_events.unsubscribe(subscriber)
+
+def stream_ticket_hash(ticket: str) -> str:
+    # Only the hash is stored, so reading the collection does not yield usable tickets
+    return hashlib.sha256(ticket.encode("utf-8")).hexdigest()
+
+@api_router.post("/admin/queue-events/ticket")
+async def issue_queue_event_ticket(current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
+    """Short-lived, single-use ticket for opening the queue event stream from a browser"""
+    database = await get_database()
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database connection failed")
     
-    # Add agent information
-    for reward in rewards:
-        agent = await database.users.find_one({"id": reward["agent_id"]})
-        if agent:
-            reward["agent_name"] = agent.get("name", agent.get("username"))
+    ticket = secrets.token_urlsafe(32)
+    await database.stream_tickets.insert_one({
+        "ticket_hash": stream_ticket_hash(ticket),
+        "user_id": current_user["id"],
+        "used": False,
+        "expires_at": datetime.utcnow() + timedelta(seconds=QUEUE_EVENT_TICKET_TTL_SECONDS)
+    })
+    return {"ticket": ticket, "expires_in": int(QUEUE_EVENT_TICKET_TTL_SECONDS)}
+
+async def redeem_stream_ticket(ticket: str) -> dict:
+    database = await get_database()
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database connection failed")
     
-    return convert_objectid_to_string(rewards)
+    # Claimed atomically, so a ticket opens one stream on whichever worker sees it first
+    claimed = await database.stream_tickets.find_one_and_update(
+        {"ticket_hash": stream_ticket_hash(ticket), "used": False, "expires_at": {"$gt": datetime.utcnow()}},
+        {"$set": {"used": True}},
+        projection={"_id": 0, "user_id": 1}
+    )
+    if claimed is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired stream ticket")
+    user = await load_user(claimed["user_id"])
+    if not user.get("is_active", True):
+        raise HTTPException(status_code=401, detail="Account is deactivated")
+    return user
+
+@api_router.get("/admin/queue-events")
+async def stream_admin_queue_events(request: Request, ticket: Optional[str] = None, last_event_id: Optional[str] = None, credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    """Server-Sent Events for the coin and reward request queues.
+    
+    Events are coin_request.created/approved/rejected and reward_request.created/approved.
+    EventSource cannot send headers, so browsers first POST /admin/queue-events/ticket and
+    connect with ?ticket=; other clients may send the bearer token as usual. A ticket opens
+    one connection, so a browser reconnect takes a new ticket and passes ?last_event_id=.
+    Only events published by this worker are seen; a reset event means reload the listings.
+    """
+    if credentials is not None:
+        principal = await principal_for_token(credentials.credentials)
+    elif ticket:
+        principal = await redeem_stream_ticket(ticket)
+    else:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if principal["role"] not in (UserRole.ADMIN.value, UserRole.SUPER_ADMIN.value):
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    
+    backlog, subscriber = queue_events.subscribe(request.headers.get("last-event-id") or last_event_id)
+    return StreamingResponse(
+        stream_queue_events(request, backlog, subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Agent Routes
 @api_router.post("/agent/coin-request")
@@ -830,10 +3135,14 @@ async def create_coin_request(sale_data: dict, current_user: dict = Depends(requ
         agent_id=current_user["id"],
         sale_amount=sale_amount,
         coins_requested=calculation["coins"],
-        deposits_requested=calculation["deposits"]
+        deposits_requested=calculation["deposits"],
+        **agent_display_fields(current_user)
     )
     
-    await database.sale_requests.insert_one(sale_request.dict())
+    sale_request_dict = sale_request.dict()
+    await database.sale_requests.insert_one(sale_request_dict)
+    sale_request_dict.pop("_id", None)
+    queue_events.publish("coin_request", "created", sale_request_dict)
     return {"message": "Coin request submitted successfully"}
 
 @api_router.get("/agent/dashboard")
@@ -841,81 +3150,80 @@ async def get_agent_dashboard(current_user: dict = Depends(require_role([UserRol
     database = await get_database()
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
-        
-    agent = await database.users.find_one({"id": current_user["id"]})
-    if not agent:
-        raise HTTPException(status_code=404, detail="Agent not found")
     
-    # Get pending coin requests (renamed from sale requests)
-    pending_requests = await database.sale_requests.find({
-        "agent_id": current_user["id"],
-        "status": "pending"
-    }).to_list(1000)
+    # The principal cache already holds the full agent document; a token-only principal
+    # (self-contained mode) has no counters, so fall back to the cached load
+    agent = current_user if "deposits" in current_user else await load_user(current_user["id"])
     
     # Calculate achievement percentage
     target_monthly = agent.get("target_monthly", 0)
     current_deposits = agent.get("deposits", 0)
     achievement_percentage = (current_deposits / target_monthly * 100) if target_monthly > 0 else 0
     
+    # Index-only count on (agent_id, status)
+    pending_requests = await database.sale_requests.count_documents({
+        "agent_id": current_user["id"],
+        "status": "pending"
+    })
+    
     return {
         "agent_info": {
             "name": agent.get("name", ""),
             "coins": agent.get("coins", 0),
             "deposits": agent.get("deposits", 0),
             "total_sales": agent.get("total_sales", 0),
+            "coins_redeemed": agent.get("coins_redeemed", 0),
             "target_monthly": target_monthly,
             "achievement_percentage": round(achievement_percentage, 2)
         },
-        "pending_coin_requests": len(pending_requests)
+        "pending_coin_requests": pending_requests
     }
 
 @api_router.get("/agent/leaderboard")
-async def get_agent_leaderboard(current_user: dict = Depends(require_role([UserRole.AGENT]))):
-    database = await get_database()
-    if database is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
-    # Get all agents sorted by deposits (highest first)
-    agents = await database.users.find({"role": "agent"}).to_list(1000)
-    
-    # Sort by deposits and prepare leaderboard
-    leaderboard = []
-    for agent in agents:
-        # Get total coins redeemed (from reward_bag)
-        coins_redeemed = 0
-        rewards = await database.reward_bag.find({"agent_id": agent["id"]}).to_list(1000)
-        
-        # Calculate total coins redeemed by looking at the coin cost of redeemed prizes
-        for reward in rewards:
-            prize = await database.prizes.find_one({"id": reward["prize_id"]})
-            if prize:
-                coins_redeemed += prize.get("coin_cost", 0)
-        
-        leaderboard.append({
-            "name": agent.get("name", agent.get("username", "Unknown")),
-            "deposits": agent.get("deposits", 0),
-            "coins_redeemed": coins_redeemed,
-            "total_sales": agent.get("total_sales", 0),
-            "is_current_user": agent["id"] == current_user["id"]
-        })
-    
-    # Sort by deposits (descending)
-    leaderboard.sort(key=lambda x: x["deposits"], reverse=True)
-    
-    # Add rank
-    for i, agent in enumerate(leaderboard):
-        agent["rank"] = i + 1
-    
-    return leaderboard
+async def get_agent_leaderboard(top: int = LEADERBOARD_TOP_K, neighbours: int = LEADERBOARD_NEIGHBOURS, current_user: dict = Depends(require_role([UserRole.AGENT]))):
+    # Served from the in-memory index; the database is only read if startup could not build it
+    if not leaderboard.loaded:
+        database = await get_database()
+        if database is None:
+            raise HTTPException(status_code=500, detail="Database connection failed")
+        await leaderboard.ensure_loaded(database)
+    
+    top = max(1, min(top, MAX_PAGE_SIZE))
+    neighbours = max(0, min(neighbours, MAX_PAGE_SIZE))
+    return leaderboard.view(current_user["id"], top, neighbours)
 
 @api_router.get("/shop/prizes")
-async def get_shop_prizes(current_user: dict = Depends(get_current_user)):
+async def get_shop_prizes(request: Request, response: Response, page: PageParams = Depends(), current_user: dict = Depends(get_current_user)):
     database = await get_database()
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
+    
+    etag = catalog_etag("active", await catalog_state(database), page)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=catalog_cache_headers(etag))
         
-    prizes = await database.prizes.find({"is_active": True}).to_list(1000)
-    return convert_objectid_to_string(prizes)
+    prizes, next_cursor = await fetch_page(prize_catalog.source(database), {"is_active": True}, None, PRIZE_SORT, page)
+    response.headers.update(catalog_cache_headers(etag))
+    return page_response(convert_objectid_to_string(prizes), next_cursor, page)
+
+async def compensate_redemption(database, agent_id: str, coin_cost: float, restock_prize_id: Optional[str] = None):
+    """Undo the writes of a redeem that failed part way, so a failed redeem costs nothing"""
+    try:
+        await database.users.update_one(
+            {"id": agent_id},
+            {"$inc": {"coins": coin_cost, "coins_redeemed": -coin_cost}}
+        )
+        principal_cache.invalidate(agent_id)
+        if restock_prize_id:
+            restocked = await database.prizes.find_one_and_update(
+                {"id": restock_prize_id},
+                {"$inc": {"quantity_available": 1}},
+                return_document=ReturnDocument.AFTER
+            )
+            await catalog_version.bump(database)
+            await prize_catalog.put(restocked)
+    except Exception as e:
+        print(f"Failed to compensate redemption for agent {agent_id}: {e}")
 
 @api_router.post("/shop/redeem")
 async def redeem_prize(redeem_data: dict, current_user: dict = Depends(require_role([UserRole.AGENT]))):
@@ -925,50 +3233,74 @@ async def redeem_prize(redeem_data: dict, current_user: dict = Depends(require_r
         
     prize_id = redeem_data.get("prize_id")
     
-    # Get prize and agent info
-    prize = await database.prizes.find_one({"id": prize_id, "is_active": True})
-    agent = await database.users.find_one({"id": current_user["id"]})
-    
+    # The prize comes from the in-process catalog; balance and stock are enforced by the writes below
+    prize = await prize_catalog.source(database).find_one({"id": prize_id, "is_active": True})
     if not prize:
         raise HTTPException(status_code=404, detail="Prize not found")
-    
-    if agent.get("coins", 0) < prize["coin_cost"]:
-        raise HTTPException(status_code=400, detail="Insufficient coins")
-    
-    # Check quantity if limited
-    if prize.get("is_limited", False) and prize.get("quantity_available", 0) <= 0:
+    is_limited = prize.get("is_limited", False)
+    if is_limited and prize.get("quantity_available", 0) <= 0:
         raise HTTPException(status_code=400, detail="Prize out of stock")
-    
-    # Create reward bag item
-    reward_item = RewardBagItem(
-        agent_id=current_user["id"],
-        prize_id=prize_id,
-        prize_name=prize["name"]
-    )
-    
-    # Update agent coins and prize quantity
-    await database.users.update_one(
-        {"id": current_user["id"]},
-        {"$inc": {"coins": -prize["coin_cost"]}}
+    coin_cost = prize["coin_cost"]
+    
+    # The filter only matches while the agent can still afford the prize, so parallel
+    # redeems cannot take the balance below zero
+    agent = await database.users.find_one_and_update(
+        {"id": current_user["id"], "coins": {"$gte": coin_cost}},
+        {"$inc": {"coins": -coin_cost, "coins_redeemed": coin_cost}},
+        projection={"_id": 0, "name": 1, "username": 1},
+        return_document=ReturnDocument.AFTER
     )
+    if agent is None:
+        raise HTTPException(status_code=400, detail="Insufficient coins")
+    principal_cache.invalidate(current_user["id"])
     
-    if prize.get("is_limited", False):
-        await database.prizes.update_one(
-            {"id": prize_id},
-            {"$inc": {"quantity_available": -1}}
+    updated_prize = None
+    try:
+        if is_limited:
+            # Likewise only matches while a unit is left
+            updated_prize = await database.prizes.find_one_and_update(
+                {"id": prize_id, "is_active": True, "quantity_available": {"$gt": 0}},
+                {"$inc": {"quantity_available": -1}},
+                return_document=ReturnDocument.AFTER
+            )
+            if updated_prize is None:
+                raise HTTPException(status_code=400, detail="Prize out of stock")
+        
+        reward_item = RewardBagItem(
+            agent_id=current_user["id"],
+            prize_id=prize_id,
+            prize_name=prize["name"],
+            coin_cost=coin_cost,
+            **agent_display_fields(agent)
         )
-    
-    await database.reward_bag.insert_one(reward_item.dict())
+        await database.reward_bag.insert_one(reward_item.dict())
+    except Exception:
+        await compensate_redemption(database, current_user["id"], coin_cost, prize_id if updated_prize else None)
+        raise
+    
+    if updated_prize is not None:
+        # Stock is part of the listing, so limited prizes change the catalog
+        await catalog_version.bump(database)
+        await prize_catalog.put(updated_prize)
+    leaderboard.adjust(current_user["id"], {"coins_redeemed": coin_cost})
+    await record_ledger_entries(database, [LedgerEntry(
+        agent_id=current_user["id"],
+        kind="prize_redeemed",
+        reference_id=reward_item.id,
+        coins=-coin_cost,
+        coins_redeemed=coin_cost,
+        created_by=current_user["id"]
+    )])
     return {"message": "Prize redeemed successfully"}
 
 @api_router.get("/agent/reward-bag")
-async def get_reward_bag(current_user: dict = Depends(require_role([UserRole.AGENT]))):
+async def get_reward_bag(page: PageParams = Depends(), current_user: dict = Depends(require_role([UserRole.AGENT]))):
     database = await get_database()
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
         
-    rewards = await database.reward_bag.find({"agent_id": current_user["id"]}).to_list(1000)
-    return convert_objectid_to_string(rewards)
+    rewards, next_cursor = await fetch_page(database.reward_bag, {"agent_id": current_user["id"]}, None, REWARD_SORT, page)
+    return page_response(convert_objectid_to_string(rewards), next_cursor, page)
 
 @api_router.post("/agent/reward-bag/{reward_id}/request-use")
 async def request_use_reward(reward_id: str, current_user: dict = Depends(require_role([UserRole.AGENT]))):
@@ -988,24 +3320,23 @@ async def request_use_reward(reward_id: str, current_user: dict = Depends(requir
         {"id": reward_id},
         {"$set": {"status": "pending_use"}}
     )
+    reward.pop("_id", None)
+    queue_events.publish("reward_request", "created", {**reward, "status": "pending_use"})
     
     return {"message": "Use request submitted for admin approval"}
 
 @api_router.get("/admin/reward-requests")
-async def get_pending_reward_requests(current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
+async def get_pending_reward_requests(page: PageParams = Depends(), loaders: RequestLoaders = Depends(get_loaders), current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
     database = await get_database()
     if database is None:
         raise HTTPException(status_code=500, detail="Database connection failed")
         
-    rewards = await database.reward_bag.find({"status": "pending_use"}).to_list(1000)
+    rewards, next_cursor = await fetch_page(database.reward_bag, {"status": "pending_use"}, None, REWARD_SORT, page)
     
-    # Add agent information
-    for reward in rewards:
-        agent = await database.users.find_one({"id": reward["agent_id"]})
-        if agent:
-            reward["agent_name"] = agent.get("name", agent.get("username"))
+    # Agent name is stored on the reward itself
+    await attach_missing_agent_fields(loaders, rewards)
     
-    return convert_objectid_to_string(rewards)
+    return page_response(convert_objectid_to_string(rewards), next_cursor, page)
 
 @api_router.put("/admin/reward-requests/{reward_id}/approve")
 async def approve_reward_use(reward_id: str, current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.SUPER_ADMIN]))):
@@ -1024,9 +3355,111 @@ async def approve_reward_use(reward_id: str, current_user: dict = Depends(requir
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Reward request not found")
+    queue_events.publish("reward_request", "approved", {"id": reward_id, "approved_by": current_user["id"]})
     
     return {"message": "Reward use approved successfully"}
 
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+@api_router.get("/health/live")
+async def liveness():
+    return {"status": "ok"}
+
+def readiness_status(state: str) -> dict:
+    return {"status": state, **readiness, "circuit_breaker": db_breaker.stats()}
+
+@api_router.get("/health/ready")
+async def readiness_check():
+    if not readiness["started"]:
+        raise HTTPException(status_code=503, detail=readiness_status("starting"))
+    if not readiness["bootstrapped"]:
+        # Without indexes and migrations the worker must not take traffic
+        raise HTTPException(status_code=503, detail=readiness_status("bootstrapping"))
+    try:
+        if await get_database() is None:
+            raise HTTPException(status_code=503, detail=readiness_status("database unavailable"))
+        if not readiness["pool_warmed"]:
+            await warm_connection_pool()
+        await ping_database()
+    except HTTPException as e:
+        raise HTTPException(status_code=503, detail=readiness_status("database unavailable"), headers=e.headers)
+    except Exception:
+        raise HTTPException(status_code=503, detail=readiness_status("database unavailable"))
+    return readiness_status("ready")
+
+async def bootstrap_database(database):
+    """Startup work that needs the database: indexes, migrations, the super admin and in-process state"""
+    try:
+        await warm_connection_pool()
+    except Exception as e:
+        print(f"MongoDB pool warm-up failed: {e}")
+    await ensure_indexes(database)
+    await run_migrations(database)
+    await initialize_super_admin()
+    await revocation_filter.load(database)
+    try:
+        await leaderboard.rebuild(database)
+    except Exception as e:
+        # The first leaderboard request retries the build
+        print(f"Leaderboard build failed: {e}")
+    try:
+        await prize_catalog.load(database)
+    except Exception as e:
+        # Prize reads go to Mongo until keep_current() manages a load
+        print(f"Prize catalog load failed: {e}")
+    readiness["bootstrapped"] = True
+
+async def bootstrap_when_connected():
+    """Retry the bootstrap after a boot without the database; /health/ready stays 503 until it completes"""
+    while not readiness["bootstrapped"]:
+        await asyncio.sleep(BOOTSTRAP_RETRY_SECONDS)
+        try:
+            database = await get_database()
+            if database is not None:
+                await bootstrap_database(database)
+                print("Startup bootstrap completed after the database became reachable")
+        except Exception as e:
+            print(f"Startup bootstrap failed, retrying in {BOOTSTRAP_RETRY_SECONDS}s: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    database = await connect_database()
+    if database is None:
+        db_breaker.record_failure()
+    else:
+        try:
+            await bootstrap_database(database)
+        except Exception as e:
+            print(f"Startup bootstrap failed: {e}")
+    
+    background_tasks = [
+        asyncio.create_task(sync_revocations_periodically()),
+        asyncio.create_task(refresh_leaderboard_periodically()),
+        asyncio.create_task(prize_catalog.keep_current()),
+        asyncio.create_task(snapshot_ledger_periodically()),
+        asyncio.create_task(reconcile_ledger_periodically())
+    ]
+    if not readiness["bootstrapped"]:
+        background_tasks.append(asyncio.create_task(bootstrap_when_connected()))
+    readiness["started"] = True
+    
+    yield
+    
+    readiness["started"] = False
+    for task in background_tasks:
+        task.cancel()
+    password_pool.shutdown()
+    bulk_password_pool.shutdown()
+    close_database()
+
+# Create the main app without a prefix
+app = FastAPI(lifespan=lifespan)
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -1038,17 +3471,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
-@app.on_event("startup")
-async def startup_event():
-    await initialize_super_admin()
+@app.exception_handler(ConnectionFailure)
+async def database_unavailable_handler(request, exc):
+    # Operation-level failures (server selection timeouts, dropped connections)
+    # count towards opening the breaker too
+    db_breaker.record_failure()
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database temporarily unavailable"},
+        headers={"Retry-After": str(db_breaker.retry_after_seconds())}
+    )
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+if QUERY_DEBUG:
+    @app.middleware("http")
+    async def count_request_queries(request: Request, call_next):
+        counter = [0]
+        token = _request_query_count.set(counter)
+        try:
+            response = await call_next(request)
+        finally:
+            _request_query_count.reset(token)
+        response.headers["X-Query-Count"] = str(counter[0])
+        return response
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""Measures the pure Python cost of the API handlers on the in-memory storage engine.
+
+No Mongo server or running backend is needed: the handlers in backend/server.py
+are awaited directly against STORAGE_ENGINE=memory with a seeded tenant.
+
+    python backend_benchmark.py --agents 1000 --iterations 50
+    python backend_benchmark.py --payload --agents 5000
+    python backend_benchmark.py --leaderboard 100 500 1500 3000
+    python backend_benchmark.py --bulk-agents 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+os.environ.setdefault("STORAGE_ENGINE", "memory")
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+import server  # noqa: E402
+
+# A single precomputed hash keeps seeding fast; bcrypt cost is not what we measure here
+PASSWORD_HASH = server.hash_password("benchmark")
+
+
+def print_separator():
+    print("=" * 80)
+
+
+async def seed_tenant(database, agent_count, prizes=20, requests_per_agent=2, rewards_per_agent=2):
+    """Create one super admin, one admin and agent_count agents with requests and rewards"""
+    now = datetime.utcnow()
+    super_admin = server.User(username="bench.super", role=server.UserRole.SUPER_ADMIN, name="Bench Super").dict()
+    super_admin["password_hash"] = PASSWORD_HASH
+    admin = server.User(username="bench.admin", role=server.UserRole.ADMIN, name="Bench Admin",
+                        created_by=super_admin["id"], can_create_prizes=True).dict()
+    admin["password_hash"] = PASSWORD_HASH
+    await database.users.insert_one(super_admin)
+    await database.users.insert_one(admin)
+
+    prize_docs = []
+    for index in range(prizes):
+        prize = server.Prize(name=f"Prize {index}", description="", coin_cost=float(1 + index % 5),
+                             created_by=super_admin["id"]).dict()
+        prize_docs.append(prize)
+        await database.prizes.insert_one(prize)
+
+    agents = []
+    for index in range(agent_count):
+        agent = server.Agent(username=f"agent{index:05d}", role=server.UserRole.AGENT, name=f"Agent {index}",
+                             created_by=admin["id"], deposits=float(index % 97), coins=float(index % 13),
+                             created_at=now - timedelta(seconds=index)).dict()
+        agent["password_hash"] = PASSWORD_HASH
+        agents.append(agent)
+        await database.users.insert_one(agent)
+
+        for request_index in range(requests_per_agent):
+            sale_request = server.SaleRequest(agent_id=agent["id"], sale_amount="250",
+                                              coins_requested=1, deposits_requested=1.5).dict()
+            await database.sale_requests.insert_one(sale_request)
+
+        for reward_index in range(rewards_per_agent):
+            prize = prize_docs[(index + reward_index) % len(prize_docs)]
+            reward = server.RewardBagItem(agent_id=agent["id"], prize_id=prize["id"], prize_name=prize["name"],
+                                          coin_cost=prize["coin_cost"],
+                                          status="pending_use" if reward_index == 0 else "unused").dict()
+            await database.reward_bag.insert_one(reward)
+            await database.users.update_one({"id": agent["id"]}, {"$inc": {"coins_redeemed": prize["coin_cost"]}})
+
+    return super_admin, admin, agents
+
+
+def build_scenarios(database, super_admin, admin, agent):
+    """Endpoint name -> zero-argument coroutine factory"""
+    def loaders():
+        # A fresh loader set per call, as FastAPI builds one per request
+        return server.RequestLoaders(database)
+
+    def conditional(handler, **kwargs):
+        # A plain GET without If-None-Match, so the listing is built every time
+        request = server.Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+        return handler(request=request, response=server.Response(), page=server.PageParams(), **kwargs)
+
+    return {
+        "GET /super-admin/all-users": lambda: server.get_all_users(page=server.PageParams(), current_user=super_admin),
+        "GET /super-admin/users/agents": lambda: server.get_agent_users_with_credentials(page=server.PageParams(), current_user=super_admin),
+        "GET /admin/agents (admin)": lambda: server.get_all_agents(page=server.PageParams(), current_user=admin),
+        "GET /admin/all-agents": lambda: server.get_all_agents_for_admin(page=server.PageParams(), current_user=admin),
+        "GET /admin/coin-requests": lambda: server.get_pending_coin_requests(page=server.PageParams(), loaders=loaders(), current_user=admin),
+        "GET /admin/reward-requests": lambda: server.get_pending_reward_requests(page=server.PageParams(), loaders=loaders(), current_user=admin),
+        "GET /agent/dashboard": lambda: server.get_agent_dashboard(current_user=agent),
+        "GET /agent/leaderboard": lambda: server.get_agent_leaderboard(current_user=agent),
+        "GET /shop/prizes": lambda: conditional(server.get_shop_prizes, current_user=agent),
+        "GET /admin/shop/prizes": lambda: conditional(server.get_shop_prizes_admin_view, current_user=admin),
+        "GET /agent/reward-bag": lambda: server.get_reward_bag(page=server.PageParams(), current_user=agent),
+    }
+
+
+async def time_scenario(factory, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await factory()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "mean": statistics.mean(samples),
+        "p50": samples[len(samples) // 2],
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    }
+
+
+async def run_endpoint_benchmark(agent_count, iterations):
+    database = await server.connect_database()
+    await server.ensure_indexes(database)
+    super_admin, admin, agents = await seed_tenant(database, agent_count)
+
+    print_separator()
+    print(f"Endpoint latency on the in-memory engine ({agent_count} agents, {iterations} iterations)")
+    print_separator()
+    print(f"{'endpoint':<36}{'mean ms':>12}{'p50 ms':>12}{'p95 ms':>12}")
+    for name, factory in build_scenarios(database, super_admin, admin, agents[0]).items():
+        result = await time_scenario(factory, iterations)
+        print(f"{name:<36}{result['mean']:>12.2f}{result['p50']:>12.2f}{result['p95']:>12.2f}")
+    print_separator()
+
+
+def payload_bytes(documents):
+    return len(json.dumps(documents, default=str).encode("utf-8"))
+
+
+async def run_payload_benchmark(agent_count):
+    """Compare listing payloads with full user documents (the pre-projection shape)"""
+    database = await server.connect_database()
+    await server.ensure_indexes(database)
+    super_admin, admin, agents = await seed_tenant(database, agent_count, requests_per_agent=0, rewards_per_agent=0)
+
+    listings = {
+        "GET /super-admin/all-users": ({"role": {"$in": ["admin", "agent"]}},
+                                       lambda: server.get_all_users(page=server.PageParams(), current_user=super_admin)),
+        "GET /super-admin/users/agents": ({"role": "agent"},
+                                          lambda: server.get_agent_users_with_credentials(page=server.PageParams(), current_user=super_admin)),
+        "GET /admin/agents": ({"role": "agent"}, lambda: server.get_all_agents(page=server.PageParams(), current_user=super_admin)),
+        "GET /admin/all-agents": ({"role": "agent"}, lambda: server.get_all_agents_for_admin(page=server.PageParams(), current_user=admin)),
+    }
+
+    print_separator()
+    print(f"Listing payload sizes ({agent_count} agents)")
+    print_separator()
+    print(f"{'endpoint':<36}{'full docs KB':>16}{'projected KB':>16}{'saved':>10}")
+    for name, (query, factory) in listings.items():
+        response = await factory()
+        # Full documents as they were sent before projections, with _id stringified
+        full_documents = server.convert_objectid_to_string(await database.users.find(query).to_list(len(response)))
+        before = payload_bytes(full_documents)
+        after = payload_bytes(response)
+        saved = (1 - after / before) * 100 if before else 0.0
+        print(f"{name:<36}{before / 1024:>16.1f}{after / 1024:>16.1f}{saved:>9.1f}%")
+    print_separator()
+
+
+async def nested_loop_leaderboard(database, current_user):
+    """The leaderboard as it was computed before the aggregation, for comparison"""
+    agents = await database.users.find({"role": "agent"}).to_list(None)
+    leaderboard = []
+    queries = 1
+    for agent in agents:
+        coins_redeemed = 0
+        rewards = await database.reward_bag.find({"agent_id": agent["id"]}).to_list(None)
+        queries += 1
+        for reward in rewards:
+            prize = await database.prizes.find_one({"id": reward["prize_id"]})
+            queries += 1
+            if prize:
+                coins_redeemed += prize.get("coin_cost", 0)
+        leaderboard.append({"name": agent.get("name"), "deposits": agent.get("deposits", 0),
+                            "coins_redeemed": coins_redeemed, "is_current_user": agent["id"] == current_user["id"]})
+    leaderboard.sort(key=lambda x: x["deposits"], reverse=True)
+    return leaderboard, queries
+
+
+async def run_leaderboard_benchmark(agent_counts, iterations):
+    """Leaderboard latency as the agent count grows: nested loop vs single aggregation vs in-memory index"""
+    print_separator()
+    print(f"GET /agent/leaderboard on the in-memory engine ({iterations} iterations per size)")
+    print("Round trips are what dominates against a real server; in-memory latency shows the CPU side")
+    print_separator()
+    print(f"{'agents':>8}{'loop queries':>14}{'loop p50 ms':>14}{'pipeline p50 ms':>18}{'index p50 ms':>15}")
+    for agent_count in agent_counts:
+        # A fresh database per size so results do not accumulate between runs
+        server.db = server.InMemoryDatabase(f"leaderboard_{agent_count}")
+        await server.ensure_indexes(server.db)
+        _, _, agents = await seed_tenant(server.db, agent_count, requests_per_agent=0)
+        agent = agents[0]
+
+        _, loop_queries = await nested_loop_leaderboard(server.db, agent)
+        loop = await time_scenario(lambda: nested_loop_leaderboard(server.db, agent), iterations)
+        pipeline = await time_scenario(
+            lambda: server.db.users.aggregate(server.leaderboard_pipeline()).to_list(None), iterations
+        )
+        await server.leaderboard.rebuild(server.db)
+        index = await time_scenario(lambda: server.get_agent_leaderboard(current_user=agent), iterations)
+        print(f"{agent_count:>8}{loop_queries:>14}{loop['p50']:>14.2f}{pipeline['p50']:>18.2f}{index['p50']:>15.2f}")
+    print_separator()
+
+
+async def run_bulk_agents_benchmark(row_count):
+    """POST /admin/agents/bulk with row_count new agents; bcrypt dominates, so this measures the hash pool"""
+    database = await server.connect_database()
+    await server.ensure_indexes(database)
+    super_admin, admin, _ = await seed_tenant(database, 0)
+    body = json.dumps([{"username": f"bulk{index:05d}", "password": f"secret-{index}"} for index in range(row_count)]).encode()
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+    request = server.Request({"type": "http", "method": "POST", "path": "/",
+                              "headers": [(b"content-type", b"application/json")]}, receive)
+
+    started = time.perf_counter()
+    response = await server.create_agents_bulk(request, current_user=admin)
+    elapsed = time.perf_counter() - started
+    pool = server.bulk_password_pool.stats()
+
+    print_separator()
+    print(f"POST /admin/agents/bulk with {row_count} rows ({pool['workers']} hash workers, {os.cpu_count()} CPUs)")
+    print_separator()
+    print(f"created: {response['created']}  seconds: {elapsed:.2f}  rows/s: {row_count / elapsed:.1f}")
+    print(f"projected for 1,000 rows on this host: {1000 / (row_count / elapsed):.0f} s")
+    print_separator()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, default=1000, help="number of agents to seed")
+    parser.add_argument("--iterations", type=int, default=20, help="calls per endpoint")
+    parser.add_argument("--payload", action="store_true", help="measure listing payload sizes instead of latency")
+    parser.add_argument("--leaderboard", type=int, nargs="*", metavar="AGENTS",
+                        help="measure leaderboard latency for each agent count (default 100 500 1500)")
+    parser.add_argument("--bulk-agents", type=int, metavar="ROWS",
+                        help="time a bulk agent import of ROWS new agents (password hashing throughput)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.payload:
+        asyncio.run(run_payload_benchmark(args.agents))
+    elif args.bulk_agents:
+        asyncio.run(run_bulk_agents_benchmark(args.bulk_agents))
+    elif args.leaderboard is not None:
+        asyncio.run(run_leaderboard_benchmark(args.leaderboard or [100, 500, 1500], args.iterations))
+    else:
+        asyncio.run(run_endpoint_benchmark(args.agents, args.iterations))
@@ -5,6 +5,62 @@ import './App.css';
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Access tokens are short-lived; transparently swap the refresh token for a
+// new pair when a request comes back 401 and replay it once.
+let refreshPromise = null;
+
+const storeTokens = (accessToken, refreshToken) => {
+  localStorage.setItem('token', accessToken);
+  if (refreshToken) {
+    localStorage.setItem('refresh_token', refreshToken);
+  }
+  axios.defaults.headers.common['Authorization'] = `Bearer ${accessToken}`;
+};
+
+const clearTokens = () => {
+  localStorage.removeItem('token');
+  localStorage.removeItem('refresh_token');
+  delete axios.defaults.headers.common['Authorization'];
+};
+
+axios.interceptors.response.use(
+  (response) => response,
+  async (error) => {
+    const original = error.config;
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (
+      error.response?.status !== 401 ||
+      !refreshToken ||
+      !original ||
+      original._retried ||
+      /\/auth\/(login|refresh|logout)$/.test(original.url || '')
+    ) {
+      return Promise.reject(error);
+    }
+
+    original._retried = true;
+    try {
+      if (!refreshPromise) {
+        refreshPromise = axios
+          .post(`${API}/auth/refresh`, { refresh_token: refreshToken })
+          .then((response) => {
+            storeTokens(response.data.access_token, response.data.refresh_token);
+            return response.data.access_token;
+          })
+          .finally(() => {
+            refreshPromise = null;
+          });
+      }
+      const accessToken = await refreshPromise;
+      original.headers['Authorization'] = `Bearer ${accessToken}`;
+      return axios(original);
+    } catch (refreshError) {
+      clearTokens();
+      return Promise.reject(error);
+    }
+  }
+);
+
 // Auth Context
 const AuthContext = createContext();
 
@@ -27,8 +83,7 @@ const AuthProvider = ({ children }) => {
       const response = await axios.get(`${API}/auth/me`);
       setUser(response.data);
     } catch (error) {
-      localStorage.removeItem('token');
-      delete axios.defaults.headers.common['Authorization'];
+      clearTokens();
       setUser(null);
     } finally {
       setLoading(false);
@@ -38,10 +93,9 @@ const AuthProvider = ({ children }) => {
   const login = async (username, password) => {
     try {
       const response = await axios.post(`${API}/auth/login`, { username, password });
-      const { access_token, user: userData } = response.data;
+      const { access_token, refresh_token, user: userData } = response.data;
       
-      localStorage.setItem('token', access_token);
-      axios.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
+      storeTokens(access_token, refresh_token);
       setUser(userData);
       return true;
     } catch (error) {
@@ -49,9 +103,14 @@ const AuthProvider = ({ children }) => {
     }
   };
 
-  const logout = () => {
-    localStorage.removeItem('token');
-    delete axios.defaults.headers.common['Authorization'];
+  const logout = async () => {
+    const refreshToken = localStorage.getItem('refresh_token');
+    try {
+      await axios.post(`${API}/auth/logout`, { refresh_token: refreshToken });
+    } catch (error) {
+      // Tokens are dropped locally even if the server could not revoke them
+    }
+    clearTokens();
     setUser(null);
   };
 
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""Concurrency stress test for /shop/redeem on the in-memory storage engine.
+
+Fires simultaneous redeems at one limited prize and checks that stock and coin
+balances come out exact. Every storage call yields to the event loop first, so
+concurrent redeems interleave between round trips the way they do against a
+real server. No Mongo server or running backend is needed.
+
+    python redeem_concurrency_test.py --redeems 500 --stock 100
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("STORAGE_ENGINE", "memory")
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+import server  # noqa: E402
+
+# Test results
+test_results = {
+    "stock_limited": {"status": "Not tested", "details": ""},
+    "balance_limited": {"status": "Not tested", "details": ""}
+}
+
+
+def print_separator():
+    print("=" * 80)
+
+
+def print_step(step_name):
+    print(f"\n--- {step_name} ---")
+
+
+class YieldingCollection:
+    """Yields to the event loop before every async call, standing in for a network round trip"""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if not asyncio.iscoroutinefunction(attribute):
+            return attribute
+
+        async def call(*args, **kwargs):
+            await asyncio.sleep(0)
+            return await attribute(*args, **kwargs)
+        return call
+
+
+class YieldingDatabase:
+    def __init__(self, database):
+        self._database = database
+
+    def __getitem__(self, name):
+        return YieldingCollection(self._database[name])
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return YieldingCollection(getattr(self._database, name))
+
+
+async def fresh_database(name):
+    database = server.InMemoryDatabase(name)
+    await server.ensure_indexes(database)
+    server.db = YieldingDatabase(database)
+    return database
+
+
+async def create_agents(database, count, coins):
+    agents = []
+    for index in range(count):
+        agent = server.Agent(username=f"stress{index:05d}", role=server.UserRole.AGENT, name=f"Stress {index}",
+                             coins=coins).dict()
+        agent["password_hash"] = "x"
+        agents.append(agent)
+    await database.users.insert_many(agents)
+    return agents
+
+
+async def create_prize(database, coin_cost, stock):
+    prize = server.Prize(name="Stress prize", description="", coin_cost=coin_cost, is_limited=True,
+                         quantity_available=stock, created_by="stress").dict()
+    await database.prizes.insert_one(prize)
+    # Redeems read the prize from the process-local catalog, as in production
+    await server.prize_catalog.load(server.db)
+    return prize
+
+
+async def redeem(prize_id, agent):
+    try:
+        await server.redeem_prize({"prize_id": prize_id}, current_user=agent)
+        return "redeemed"
+    except server.HTTPException as e:
+        return e.detail
+
+
+async def fire(prize_id, agents):
+    """All redeems at once; returns (outcome counts, redeems per second)"""
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*[redeem(prize_id, agent) for agent in agents])
+    elapsed = time.perf_counter() - started
+    counts = {}
+    for outcome in outcomes:
+        counts[outcome] = counts.get(outcome, 0) + 1
+    return counts, len(agents) / elapsed
+
+
+def check(failures, description, actual, expected):
+    if actual != expected:
+        failures.append(f"{description}: expected {expected}, got {actual}")
+
+
+async def test_stock_limited(redeems, stock, coin_cost):
+    """redeems different agents race for stock units; exactly stock of them may win"""
+    print_step(f"{redeems} agents redeem one prize with {stock} in stock")
+    database = await fresh_database("redeem_stock_limited")
+    agents = await create_agents(database, redeems, coins=coin_cost * 2)
+    prize = await create_prize(database, coin_cost, stock)
+
+    counts, throughput = await fire(prize["id"], agents)
+    print(f"Outcomes: {counts}")
+    print(f"Throughput: {throughput:.0f} redeems/s")
+
+    winners = min(redeems, stock)
+    failures = []
+    check(failures, "successful redeems", counts.get("redeemed", 0), winners)
+    check(failures, "out of stock", counts.get("Prize out of stock", 0), redeems - winners)
+    stored_prize = await database.prizes.find_one({"id": prize["id"]})
+    check(failures, "stock left", stored_prize["quantity_available"], stock - winners)
+    check(failures, "reward bag items", await database.reward_bag.count_documents({"prize_id": prize["id"]}), winners)
+
+    stored_agents = await database.users.find({"role": "agent"}).to_list(None)
+    check(failures, "total coins", sum(agent["coins"] for agent in stored_agents),
+          redeems * coin_cost * 2 - winners * coin_cost)
+    check(failures, "total coins redeemed", sum(agent["coins_redeemed"] for agent in stored_agents), winners * coin_cost)
+    check(failures, "agents charged more than once", sum(1 for agent in stored_agents if agent["coins"] < coin_cost), 0)
+
+    record("stock_limited", failures, f"{counts.get('redeemed', 0)}/{redeems} redeemed at {throughput:.0f} redeems/s")
+
+
+async def test_balance_limited(redeems, affordable, coin_cost):
+    """One agent fires redeems concurrently with coins for only some of them"""
+    print_step(f"One agent fires {redeems} redeems with coins for {affordable}")
+    database = await fresh_database("redeem_balance_limited")
+    agent = (await create_agents(database, 1, coins=coin_cost * affordable))[0]
+    prize = await create_prize(database, coin_cost, redeems)
+
+    counts, throughput = await fire(prize["id"], [agent] * redeems)
+    print(f"Outcomes: {counts}")
+    print(f"Throughput: {throughput:.0f} redeems/s")
+
+    winners = min(redeems, affordable)
+    failures = []
+    check(failures, "successful redeems", counts.get("redeemed", 0), winners)
+    check(failures, "insufficient coins", counts.get("Insufficient coins", 0), redeems - winners)
+    stored_agent = await database.users.find_one({"id": agent["id"]})
+    check(failures, "coins left", stored_agent["coins"], coin_cost * (affordable - winners))
+    check(failures, "coins redeemed", stored_agent["coins_redeemed"], coin_cost * winners)
+    stored_prize = await database.prizes.find_one({"id": prize["id"]})
+    check(failures, "stock left", stored_prize["quantity_available"], redeems - winners)
+    check(failures, "reward bag items", await database.reward_bag.count_documents({"agent_id": agent["id"]}), winners)
+
+    record("balance_limited", failures, f"{counts.get('redeemed', 0)}/{redeems} redeemed at {throughput:.0f} redeems/s")
+
+
+def record(test_name, failures, summary):
+    if failures:
+        test_results[test_name] = {"status": "Failed", "details": "; ".join(failures)}
+        for failure in failures:
+            print(f"❌ {failure}")
+    else:
+        test_results[test_name] = {"status": "Success", "details": summary}
+        print(f"✅ {summary}")
+
+
+async def run_tests(args):
+    print_separator()
+    print("REDEEM CONCURRENCY STRESS TEST (in-memory storage engine)")
+    print_separator()
+    await test_stock_limited(args.redeems, args.stock, args.coin_cost)
+    await test_balance_limited(args.redeems, args.stock, args.coin_cost)
+
+    print_separator()
+    print("TEST SUMMARY:")
+    for test_name, result in test_results.items():
+        status_str = f"✅ {result['status']}" if result["status"] == "Success" else f"❌ {result['status']}"
+        print(f"{test_name}: {status_str}")
+        print(f"  Details: {result['details']}")
+    return all(result["status"] == "Success" for result in test_results.values())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redeems", type=int, default=500, help="simultaneous redeems per scenario")
+    parser.add_argument("--stock", type=int, default=100, help="units in stock, and redeems one agent can afford")
+    parser.add_argument("--coin-cost", type=float, default=2.0, help="prize cost in coins")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    passed = asyncio.run(run_tests(parse_args()))
+    sys.exit(0 if passed else 1)
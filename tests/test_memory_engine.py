@@ -0,0 +1,277 @@
+"""The in-memory storage engine must answer the queries the routes send the way MongoDB would."""
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from pymongo import ReturnDocument, UpdateOne, UpdateMany
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+from memory_engine import InMemoryDatabase  # noqa: E402
+
+NOW = datetime(2026, 1, 1)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def seeded_users():
+    database = InMemoryDatabase("engine_test")
+    users = database.users
+    run(users.create_index([("id", 1)], name="users_id_unique", unique=True))
+    run(users.create_index([("role", 1), ("deposits", -1), ("id", 1)], name="users_role_deposits_id"))
+    run(users.insert_many([
+        {"id": "a1", "role": "agent", "name": "Ann", "deposits": 30.0, "coins": 5.0, "password_hash": "x",
+         "created_at": NOW},
+        {"id": "a2", "role": "agent", "name": None, "username": "bob", "deposits": 10.0, "coins": 0.0,
+         "password_hash": "", "created_at": NOW + timedelta(seconds=1)},
+        {"id": "a3", "role": "agent", "username": "cy", "deposits": 30.0, "created_at": NOW + timedelta(seconds=2)},
+        {"id": "s1", "role": "super_admin", "name": "Root", "created_at": NOW + timedelta(seconds=3)},
+    ]))
+    return database
+
+
+def ids(documents):
+    return [document["id"] for document in documents]
+
+
+# Queries
+@pytest.mark.parametrize("query, expected", [
+    ({"role": "agent"}, ["a1", "a2", "a3"]),
+    ({"id": {"$in": ["a3", "s1", "missing"]}}, ["a3", "s1"]),
+    ({"role": {"$ne": "agent"}}, ["s1"]),
+    ({"deposits": {"$gt": 10}}, ["a1", "a3"]),
+    ({"deposits": {"$gte": 10, "$lt": 30}}, ["a2"]),
+    ({"deposits": {"$lte": "30"}}, []),  # no cross-type range matches
+    ({"coins": {"$exists": False}}, ["a3", "s1"]),
+    ({"name": None}, ["a2", "a3"]),  # null matches missing fields too
+    ({"$or": [{"id": "a1"}, {"deposits": 10.0}]}, ["a1", "a2"]),
+    ({"$and": [{"role": "agent"}, {"created_at": {"$gt": NOW}}]}, ["a2", "a3"]),
+])
+def test_find_filters(query, expected):
+    database = seeded_users()
+    assert ids(run(database.users.find(query).to_list(None))) == expected
+
+
+def test_sort_skip_limit_and_keyset_filter():
+    database = seeded_users()
+    cursor = database.users.find({"role": "agent"}).sort([("deposits", -1), ("id", 1)]).skip(1).limit(2)
+    assert ids(run(cursor.to_list(None))) == ["a3", "a2"]
+    # The shape fetch_page sends for the page after (deposits 30, id a1)
+    after = {"$or": [{"deposits": {"$lt": 30.0}}, {"deposits": 30.0, "id": {"$gt": "a1"}}]}
+    cursor = database.users.find({"$and": [{"role": "agent"}, after]}).sort([("deposits", -1), ("id", 1)])
+    assert ids(run(cursor.to_list(None))) == ["a3", "a2"]
+
+
+def test_sort_orders_missing_before_values():
+    database = seeded_users()
+    assert ids(run(database.users.find().sort("coins", 1).to_list(None))) == ["a3", "s1", "a2", "a1"]
+
+
+def test_count_documents_uses_the_same_matching():
+    database = seeded_users()
+    assert run(database.users.count_documents({"role": "agent", "deposits": {"$gte": 30}})) == 2
+
+
+# Projections
+def test_inclusion_and_exclusion_projections():
+    database = seeded_users()
+    included = run(database.users.find_one({"id": "a1"}, {"_id": 0, "id": 1, "name": 1, "missing": 1}))
+    assert included == {"id": "a1", "name": "Ann"}
+    excluded = run(database.users.find_one({"id": "a1"}, {"_id": 0, "password_hash": 0, "created_at": 0}))
+    assert excluded == {"id": "a1", "role": "agent", "name": "Ann", "deposits": 30.0, "coins": 5.0}
+
+
+def test_expression_projection_follows_mongodb_truthiness():
+    database = seeded_users()
+    projection = {
+        "_id": 0,
+        "id": 1,
+        "to_bool": {"$toBool": {"$ifNull": ["$password_hash", False]}},
+        "has_password": {"$and": [{"$ifNull": ["$password_hash", False]}, {"$ne": ["$password_hash", ""]}]},
+        "display": {"$ifNull": ["$name", "$username", "Unknown"]},
+    }
+    documents = run(database.users.find({"role": "agent"}, projection).to_list(None))
+    assert documents == [
+        {"id": "a1", "to_bool": True, "has_password": True, "display": "Ann"},
+        # $toBool("") is true in MongoDB; only null, false and 0 are false
+        {"id": "a2", "to_bool": True, "has_password": False, "display": "bob"},
+        {"id": "a3", "to_bool": False, "has_password": False, "display": "cy"},
+    ]
+
+
+def test_cond_and_not_treat_empty_string_as_true():
+    database = InMemoryDatabase("engine_test")
+    run(database.items.insert_one({"id": "i", "text": "", "zero": 0}))
+    projection = {
+        "_id": 0,
+        "text": {"$cond": ["$text", "yes", "no"]},
+        "zero": {"$cond": {"if": "$zero", "then": "yes", "else": "no"}},
+        "not_text": {"$not": ["$text"]},
+        "null_bool": {"$toBool": "$missing"},
+    }
+    assert run(database.items.find_one({}, projection)) == {"text": "yes", "zero": "no", "not_text": False, "null_bool": None}
+
+
+# Writes
+def test_update_operators_and_upsert():
+    database = seeded_users()
+    result = run(database.users.update_one({"id": "a1"}, {"$inc": {"coins": -2.0, "coins_redeemed": 2.0},
+                                                          "$set": {"name": "Anne"}}))
+    assert (result.matched_count, result.modified_count) == (1, 1)
+    assert run(database.users.find_one({"id": "a1"}, {"_id": 0, "coins": 1, "coins_redeemed": 1, "name": 1})) == \
+        {"name": "Anne", "coins": 3.0, "coins_redeemed": 2.0}
+
+    result = run(database.counters.update_one({"name": "catalog"}, {"$inc": {"value": 1},
+                                                                     "$setOnInsert": {"created": True}}, upsert=True))
+    assert result.upserted_id is not None
+    run(database.counters.update_one({"name": "catalog"}, {"$inc": {"value": 1}, "$setOnInsert": {"created": False}},
+                                     upsert=True))
+    assert run(database.counters.find_one({}, {"_id": 0})) == {"name": "catalog", "value": 2, "created": True}
+
+
+def test_update_many_reports_counts():
+    database = seeded_users()
+    result = run(database.users.update_many({"role": "agent", "deposits": 30.0}, {"$set": {"tier": "gold"}}))
+    assert (result.matched_count, result.modified_count) == (2, 2)
+    assert run(database.users.count_documents({"tier": "gold"})) == 2
+
+
+def test_conditional_find_one_and_update_is_a_guarded_debit():
+    database = seeded_users()
+    guard = {"id": "a1", "coins": {"$gte": 4.0}}
+    after = run(database.users.find_one_and_update(guard, {"$inc": {"coins": -4.0}},
+                                                   projection={"_id": 0, "coins": 1},
+                                                   return_document=ReturnDocument.AFTER))
+    assert after == {"coins": 1.0}
+    # The balance no longer satisfies the guard, so nothing is matched or changed
+    assert run(database.users.find_one_and_update(guard, {"$inc": {"coins": -4.0}})) is None
+    assert run(database.users.find_one({"id": "a1"}))["coins"] == 1.0
+
+
+def test_find_one_and_update_returns_the_document_before_by_default():
+    database = seeded_users()
+    before = run(database.users.find_one_and_update({"role": "agent"}, {"$set": {"status": "seen"}},
+                                                    sort=[("deposits", 1)], projection={"_id": 0, "id": 1}))
+    assert before == {"id": "a2"}
+
+
+def test_unique_indexes_reject_duplicates():
+    database = seeded_users()
+    with pytest.raises(DuplicateKeyError):
+        run(database.users.insert_one({"id": "a1", "role": "agent"}))
+    with pytest.raises(DuplicateKeyError):
+        run(database.users.update_one({"id": "a2"}, {"$set": {"id": "a1"}}))
+    with pytest.raises(DuplicateKeyError):
+        run(database.users.create_index([("role", 1)], name="role_unique", unique=True))
+
+
+def test_unordered_insert_many_reports_each_duplicate():
+    database = seeded_users()
+    with pytest.raises(BulkWriteError) as error:
+        run(database.users.insert_many([{"id": "a1"}, {"id": "n1"}, {"id": "a2"}], ordered=False))
+    assert [item["index"] for item in error.value.details["writeErrors"]] == [0, 2]
+    assert all(item["code"] == 11000 for item in error.value.details["writeErrors"])
+    assert run(database.users.count_documents({"id": "n1"})) == 1
+
+
+def test_bulk_write_and_delete():
+    database = seeded_users()
+    result = run(database.users.bulk_write([
+        UpdateOne({"id": "a1"}, {"$inc": {"coins": 1.0}}),
+        UpdateMany({"role": "agent"}, {"$set": {"checked": True}}),
+        UpdateOne({"id": "new"}, {"$set": {"role": "agent"}}, upsert=True),
+    ], ordered=False))
+    assert (result.matched_count, result.modified_count, result.upserted_count) == (4, 4, 1)
+    assert run(database.users.delete_many({"checked": True})).deleted_count == 3
+    assert ids(run(database.users.find().to_list(None))) == ["s1", "new"]
+
+
+def test_index_information_lists_declared_indexes():
+    database = seeded_users()
+    indexes = run(database.users.index_information())
+    assert indexes["users_id_unique"]["unique"] is True
+    assert indexes["users_role_deposits_id"]["key"] == [("role", 1), ("deposits", -1), ("id", 1)]
+
+
+# Aggregation
+def test_leaderboard_style_pipeline():
+    database = seeded_users()
+    pipeline = [
+        {"$match": {"role": "agent"}},
+        {"$sort": {"deposits": -1, "id": 1}},
+        {"$setWindowFields": {"sortBy": {"deposits": -1}, "output": {"rank": {"$rank": {}},
+                                                                    "position": {"$documentNumber": {}}}}},
+        {"$project": {"_id": 0, "id": 1, "rank": 1, "position": 1,
+                      "coins_redeemed": {"$ifNull": ["$coins_redeemed", 0]}}},
+    ]
+    assert run(database.users.aggregate(pipeline).to_list(None)) == [
+        {"id": "a1", "rank": 1, "position": 1, "coins_redeemed": 0},
+        {"id": "a3", "rank": 1, "position": 2, "coins_redeemed": 0},
+        {"id": "a2", "rank": 3, "position": 3, "coins_redeemed": 0},
+    ]
+
+
+def test_group_with_first_and_sum():
+    database = InMemoryDatabase("engine_test")
+    run(database.snapshots.insert_many([
+        {"agent_id": "a1", "through": NOW, "totals": {"coins": 1}},
+        {"agent_id": "a1", "through": NOW + timedelta(hours=1), "totals": {"coins": 2}},
+        {"agent_id": "a2", "through": NOW, "totals": {"coins": 3}},
+    ]))
+    pipeline = [
+        {"$match": {"through": {"$lte": NOW + timedelta(hours=1)}}},
+        {"$sort": {"agent_id": 1, "through": -1}},
+        {"$group": {"_id": "$agent_id", "through": {"$first": "$through"}, "totals": {"$first": "$totals"},
+                    "coins": {"$sum": "$totals.coins"}, "count": {"$sum": 1}}},
+    ]
+    assert run(database.snapshots.aggregate(pipeline).to_list(None)) == [
+        {"_id": "a1", "through": NOW + timedelta(hours=1), "totals": {"coins": 2}, "coins": 3, "count": 2},
+        {"_id": "a2", "through": NOW, "totals": {"coins": 3}, "coins": 3, "count": 1},
+    ]
+
+
+def test_lookup_unwind_and_count():
+    database = seeded_users()
+    run(database.rewards.insert_many([{"agent_id": "a1", "cost": 2}, {"agent_id": "a1", "cost": 3}]))
+    pipeline = [
+        {"$match": {"role": "agent"}},
+        {"$lookup": {"from": "rewards", "localField": "id", "foreignField": "agent_id", "as": "rewards"}},
+        {"$project": {"_id": 0, "id": 1, "spent": {"$sum": "$rewards.cost"}}},
+    ]
+    assert run(database.users.aggregate(pipeline).to_list(None)) == [
+        {"id": "a1", "spent": 5}, {"id": "a2", "spent": 0}, {"id": "a3", "spent": 0},
+    ]
+    unwound = [
+        {"$lookup": {"from": "rewards", "localField": "id", "foreignField": "agent_id", "as": "reward"}},
+        {"$unwind": "$reward"},
+        {"$count": "rewards"},
+    ]
+    assert run(database.users.aggregate(unwound).to_list(None)) == [{"rewards": 2}]
+
+
+def test_aggregate_cursor_iterates():
+    database = seeded_users()
+
+    async def collect():
+        return [document["id"] async for document in database.users.aggregate([{"$match": {"role": "agent"}}])]
+    assert run(collect()) == ["a1", "a2", "a3"]
+
+
+# Unsupported features fail loudly, the way a standalone server does
+def test_watch_raises_operation_failure_like_a_standalone_server():
+    database = seeded_users()
+    with pytest.raises(OperationFailure):
+        database.prizes.watch(full_document="updateLookup")
+
+
+def test_unknown_operators_are_rejected():
+    database = seeded_users()
+    with pytest.raises(NotImplementedError):
+        run(database.users.find({"name": {"$regex": "^A"}}).to_list(None))
+    with pytest.raises(NotImplementedError):
+        run(database.users.aggregate([{"$bucket": {}}]).to_list(None))
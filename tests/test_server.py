@@ -0,0 +1,184 @@
+"""Behaviour of server.py pieces that have to hold up under concurrency and outages."""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+os.environ.setdefault("STORAGE_ENGINE", "memory")
+os.environ.setdefault("JWT_SECRET", "test-secret-long-enough-for-hs256-keys")
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+import server  # noqa: E402
+
+
+def test_breaker_opens_once_for_failures_seen_by_concurrent_requests():
+    breaker = server.CircuitBreaker(3, 30, 1, 60)
+    for _ in range(20):
+        breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert breaker.trips == 1
+    assert breaker.retry_after_seconds() == 1
+
+
+def test_breaker_escalates_backoff_only_when_the_probe_fails():
+    breaker = server.CircuitBreaker(3, 30, 1, 60)
+    for _ in range(3):
+        breaker.record_failure()
+    breaker.retry_at = 0.0
+    assert breaker.allow_request()
+    assert breaker.state == "half_open"
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.trips == 2
+    # Second trip backs off 2s with equal jitter: somewhere in [1, 2]
+    assert 1 <= breaker.retry_after_seconds() <= 2
+
+    breaker.retry_at = 0.0
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.consecutive_trips == 0
+
+
+def test_concurrent_refreshes_with_one_token_issue_one_pair(monkeypatch):
+    database = server.InMemoryDatabase("refresh_test")
+    user = {"id": "u1", "username": "ann", "role": "agent", "is_active": True}
+    refresh_token = server.create_token_pair(user)["refresh_token"]
+
+    async def yielding_database():
+        # Every refresh suspends here, so all of them get past the filter check
+        # before any rotates the token, as they would across requests or workers
+        await asyncio.sleep(0)
+        return database
+
+    async def refresh_five_times():
+        await database.users.insert_one(dict(user))
+        await database.revoked_tokens.create_index([("jti", 1)], unique=True)
+        return await asyncio.gather(
+            *[server.refresh_tokens(server.TokenRefresh(refresh_token=refresh_token)) for _ in range(5)],
+            return_exceptions=True
+        )
+
+    monkeypatch.setattr(server, "get_database", yielding_database)
+    monkeypatch.setattr(server, "revocation_filter", server.RevocationFilter(1000, 0.01))
+    results = asyncio.run(refresh_five_times())
+
+    issued = [result for result in results if isinstance(result, dict)]
+    rejected = [result for result in results if isinstance(result, server.HTTPException)]
+    assert len(issued) == 1
+    assert len(rejected) == 4
+    assert all(error.status_code == 401 for error in rejected)
+
+
+def use_database(monkeypatch, database):
+    async def get_database():
+        return database
+    monkeypatch.setattr(server, "get_database", get_database)
+    monkeypatch.setattr(server, "review_results", server.TTLCache(100, 60))
+
+
+def seed_coin_requests(database, *request_ids):
+    async def seed():
+        await database.users.insert_one({"id": "a1", "role": "agent", "coins": 0.0, "deposits": 0.0, "total_sales": 0.0})
+        await database.sale_requests.insert_many([
+            {"id": request_id, "agent_id": "a1", "status": "pending", "coins_requested": 5.0,
+             "deposits_requested": 50.0, "sale_amount": 100.0}
+            for request_id in request_ids
+        ])
+    asyncio.run(seed())
+
+
+def fail_next_call(monkeypatch, collection, method):
+    original = getattr(collection, method)
+    calls = []
+
+    async def failing(*args, **kwargs):
+        if not calls:
+            calls.append(1)
+            raise server.ConnectionFailure("connection reset")
+        return await original(*args, **kwargs)
+    monkeypatch.setattr(collection, method, failing)
+
+
+def test_failed_credit_returns_the_coin_request_to_pending(monkeypatch):
+    database = server.InMemoryDatabase("approve_test")
+    use_database(monkeypatch, database)
+    seed_coin_requests(database, "r1")
+    reviewer = {"id": "admin1"}
+    fail_next_call(monkeypatch, database.users, "update_one")
+
+    with pytest.raises(server.ConnectionFailure):
+        asyncio.run(server.approve_coin_request("r1", current_user=reviewer))
+    request = asyncio.run(database.sale_requests.find_one({"id": "r1"}))
+    assert request["status"] == "pending"
+    assert "approved_by" not in request
+
+    asyncio.run(server.approve_coin_request("r1", current_user=reviewer))
+    agent = asyncio.run(database.users.find_one({"id": "a1"}))
+    assert agent["coins"] == 5.0
+
+
+def test_failed_batch_credit_returns_the_claimed_requests_to_pending(monkeypatch):
+    database = server.InMemoryDatabase("batch_approve_test")
+    use_database(monkeypatch, database)
+    seed_coin_requests(database, "r1", "r2")
+    reviewer = {"id": "admin1"}
+    batch = server.CoinRequestBatch(request_ids=["r1", "r2"])
+    fail_next_call(monkeypatch, database.users, "bulk_write")
+
+    with pytest.raises(server.ConnectionFailure):
+        asyncio.run(server.batch_approve_coin_requests(batch, current_user=reviewer))
+    statuses = asyncio.run(database.sale_requests.find({}, {"_id": 0, "status": 1}).to_list(None))
+    assert [request["status"] for request in statuses] == ["pending", "pending"]
+
+    result = asyncio.run(server.batch_approve_coin_requests(batch, current_user=reviewer))
+    assert result["approved"] == 2
+    agent = asyncio.run(database.users.find_one({"id": "a1"}))
+    assert agent["coins"] == 10.0
+
+
+def test_rejected_agent_credit_releases_only_that_agents_requests(monkeypatch):
+    database = server.InMemoryDatabase("batch_partial_test")
+    use_database(monkeypatch, database)
+    seed_coin_requests(database, "r1")
+    asyncio.run(database.users.insert_one({"id": "a2", "role": "agent", "coins": 0.0}))
+    asyncio.run(database.sale_requests.insert_one({
+        "id": "r2", "agent_id": "a2", "status": "pending", "coins_requested": 3.0,
+        "deposits_requested": 30.0, "sale_amount": 60.0
+    }))
+    original = database.users.bulk_write
+
+    async def reject_second_agent(requests, ordered=True, **kwargs):
+        await original(requests[:1], ordered=ordered)
+        raise BulkWriteError({"writeErrors": [{"index": 1, "code": 14, "errmsg": "type mismatch"}]})
+    monkeypatch.setattr(database.users, "bulk_write", reject_second_agent)
+
+    result = asyncio.run(server.batch_approve_coin_requests(
+        server.CoinRequestBatch(request_ids=["r1", "r2"]), current_user={"id": "admin1"}
+    ))
+    assert result["results"] == [{"id": "r1", "outcome": "approved"}, {"id": "r2", "outcome": "credit_failed"}]
+    assert result["agents_credited"] == 1
+    released = asyncio.run(database.sale_requests.find_one({"id": "r2"}))
+    assert released["status"] == "pending"
+    assert "approval_batch" not in released
+
+
+def test_migrations_stop_at_the_first_failure(monkeypatch):
+    database = server.InMemoryDatabase("migration_test")
+    applied = []
+
+    async def failing(database):
+        raise server.OperationFailure("backfill interrupted")
+
+    async def dependent(database):
+        applied.append("0002")
+    monkeypatch.setattr(server, "MIGRATIONS", [("0001_failing", failing), ("0002_dependent", dependent)])
+
+    asyncio.run(server.run_migrations(database))
+    assert applied == []
+    assert asyncio.run(database.migrations.count_documents({})) == 0